@@ -1,11 +1,11 @@
 import logging
 
-import mcerp as mcp
 import numpy as np
 from mcerp import *
 from sympy import *
 
 from Charm.models import Distribution
+from .uncertain_math import condmax
 from Charm.models import UncertaintyModel
 
 
@@ -43,13 +43,6 @@ def SUM(*arg):
     arg = np.asarray(arg) * np.ones(1)
     return reduce(lambda x,y: x+y, arg)
 
-def __has_distribution(args):
-    """ Return true if args has at least one distribution-typed element.
-    """
-
-    ts = [isinstance(arg, UncertainFunction) for arg in args]
-    return any(ts)
-
 def CONDMAX(*arg):
     """ Conditional maximum function.
         Conputes a rv X, consisting of the maximum of performance
@@ -64,18 +57,4 @@ def CONDMAX(*arg):
 
     ns = arg[::2]
     ps = arg[1::2]
-    assert ns and ps and len(ns) == len(ps)
-
-    if not __has_distribution(ns) and not __has_distribution(ps):
-        candidate = [p for n, p in zip(ns, ps) if n > 0]
-        return max(candidate)
-    else:
-        x = Distribution.GetDummy()
-        mcpts = [None] * mcp.npts
-        for i in range(mcp.npts):
-            candidate = [p._mcpts[i] if isinstance(p, UncertainFunction) else p
-                    for n, p in zip(ns, ps)
-                    if (n._mcpts[i] if isinstance(n, UncertainFunction) else n) > 0]
-            mcpts[i] = max(candidate) if candidate else Distribution.NON_ZERO_FACTOR
-        x._mcpts = np.asarray(mcpts)
-        return x
+    return condmax(ns, ps, Distribution.NON_ZERO_FACTOR)
@@ -4,7 +4,8 @@ import collections
 # https://stackoverflow.com/questions/37846492/sympy-cannot-lambdify-product
 import sympy.printing.lambdarepr as SPL
 import z3
-from sympy import symbols, IndexedBase, Function
+from sympy import symbols, IndexedBase, Function, cse, numbered_symbols
+from sympy.utilities.lambdify import lambdify
 from sympy.parsing.sympy_parser import parse_expr, convert_equals_signs, auto_symbol
 
 
@@ -97,3 +98,29 @@ class SympyHelper(object):
                     transformations=(convert_equals_signs, auto_symbol))
             expr_list.append(parsed_expr)
         return expr_list
+
+    @staticmethod
+    def lambdifyShared(args, exprs, modules=None):
+        """ Lambdifies exprs into one function computing shared subterms once.
+
+        Args:
+            args: [symbol], arguments of the generated function.
+            exprs: [expr], expressions to evaluate.
+            modules: lambdify modules.
+        Returns:
+            func: f(*args) -> [value], one value per expression.
+        """
+        replacements, reduced = cse(list(exprs), symbols=numbered_symbols('_x', exclude=set(args)))
+        syms = list(args)
+        sub_funcs = []
+        for sym, sub_expr in replacements:
+            sub_funcs.append(lambdify(tuple(syms), sub_expr, modules=modules))
+            syms.append(sym)
+        out_func = lambdify(tuple(syms), reduced, modules=modules)
+
+        def func(*vals):
+            vals = list(vals)
+            for f in sub_funcs:
+                vals.append(f(*vals))
+            return out_func(*vals)
+        return func
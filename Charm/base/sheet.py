@@ -39,7 +39,7 @@ class Sheet(object):
         self.response = set() # set of symbols.
         self.ordered_given = [] # List of symbols.
         self.sol_set = {} # key type: symbol
-        self.target_funcs = {} # key type: symbol
+        self.target_funcs = {} # key type: tuple of symbols
         self.opts = []
         self.parser = Parser()
         npts = 100
@@ -89,7 +89,7 @@ class Sheet(object):
         self.response = set() # set of symbols.
         self.ordered_given = [] # List of symbols.
         self.sol_sets = {} # key type: symbol
-        self.target_funcs = {} # key type: symbol
+        self.target_funcs = {} # key type: tuple of symbols
         self.opts = []
 
     def clear(self):
@@ -246,23 +246,23 @@ class Sheet(object):
             for k, s in self.sol_set.items():
                 logging.debug('\t{}: {}'.format(k, s))
 
-        # Generate target funcs, use cached version if possible.
-        for var in self.response:
-            if var not in self.target_funcs:
-                self.target_funcs[var] = (lambdify(tuple(self.ordered_given),
-                    self.sol_set[var], modules=[self.sym2func, u_math]))
-                logging.debug('Lamdification {} {} --\n\t{}'.format(var,
-                    self.target_funcs[var],
+        # Generate one target func for all responses, sharing common
+        # subexpressions, use cached version if possible.
+        responses = tuple(sorted(self.response, key=str))
+        if responses not in self.target_funcs:
+            self.target_funcs[responses] = SympyHelper.lambdifyShared(
+                self.ordered_given, [self.sol_set[var] for var in responses],
+                modules=[self.sym2func, u_math])
+            for var in responses:
+                logging.debug('Lamdification {} --\n\t{}'.format(var,
                     lambdastr(tuple(self.ordered_given), self.sol_set[var])))
-  
+
         # Compute response.
+        logging.debug('Solving {}'.format([str(var) for var in responses]))
+        logging.debug('Params:\n{}\n{}'.format(
+            self.ordered_given, q_ordered_given))
         q_response = {}
-        for var in self.response:
-            logging.debug('Solving {}'.format(str(var)))
-            logging.debug('Params:\n{}\n{}'.format(
-                self.ordered_given, q_ordered_given))
-            logging.debug('Calling {}'.format(self.target_funcs[var]))
-            perf = self.target_funcs[var](*tuple(q_ordered_given))
+        for var, perf in zip(responses, self.target_funcs[responses](*tuple(q_ordered_given))):
             q_response[str(var)] = perf
 
         return q_response
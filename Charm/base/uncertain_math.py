@@ -0,0 +1,187 @@
+""" Builtins evaluated over scalars, NumPy arrays and Monte Carlo distributions.
+
+Every function works sample-wise on UncertainFunction arguments, mixed freely
+with scalars, and always returns a new value: inputs are never modified, so
+results can be shared between expressions.
+"""
+
+from functools import reduce
+
+import mcerp3 as mcerp
+import numpy as np
+from sympy.printing.pycode import NumPyPrinter
+
+
+def isUncertain(x):
+    return isinstance(x, mcerp.UncertainFunction)
+
+
+def samples(x):
+    """ MC samples of x, or x itself if certain.
+    """
+    return x._mcpts if isUncertain(x) else x
+
+
+def uncertain(pts):
+    """ Wraps an array of samples into a new distribution.
+    """
+    return mcerp.UncertainFunction(np.array(pts, dtype=float))
+
+
+def _apply(func, args):
+    """ Applies the NumPy ufunc func sample-wise if any of args is uncertain.
+    """
+    if any([isUncertain(a) for a in args]):
+        return uncertain(func(*[samples(a) for a in args]))
+    return func(*args)
+
+
+def _reduce(func, builtin, args):
+    if any([isUncertain(a) for a in args]):
+        return uncertain(reduce(func, [samples(a) for a in args]))
+    if any([isinstance(a, np.ndarray) for a in args]):
+        # Batched sweep points.
+        return reduce(func, args)
+    return builtin(args)
+
+
+def umin(*args):
+    return _reduce(np.minimum, min, args)
+
+
+def umax(*args):
+    return _reduce(np.maximum, max, args)
+
+
+def ufloor(a):
+    return _apply(np.floor, (a,))
+
+
+def uceiling(a):
+    return _apply(np.ceil, (a,))
+
+
+def condmax(ns, ps, default):
+    """ Maximum of the ps whose corresponding ns are greater than 0.
+
+    With uncertain arguments the condition is evaluated per sample, samples
+    with no candidate are set to default.
+    """
+    assert ns and ps and len(ns) == len(ps)
+    args = list(ns) + list(ps)
+    if not any([isUncertain(a) for a in args]):
+        return max([p for n, p in zip(ns, ps) if n > 0])
+    npts = max([len(a._mcpts) for a in args if isUncertain(a)])
+    cond = np.array([np.broadcast_to(samples(n), (npts,)) for n in ns]) > 0
+    cand = np.array([np.broadcast_to(samples(p), (npts,)) for p in ps], dtype=float)
+    pts = np.where(cond, cand, -np.inf).max(axis=0)
+    return uncertain(np.where(cond.any(axis=0), pts, default))
+
+
+def upiecewise(conds, exprs):
+    """ Piecewise function, conditions may hold for some samples only.
+
+    Args:
+        conds: conditions in order, booleans or boolean sample arrays.
+        exprs: value for each condition.
+    Return:
+        value of the first holding condition, nan where none holds.
+    """
+    if not any([isinstance(a, np.ndarray) or isUncertain(a) for a in list(conds) + list(exprs)]):
+        for cond, expr in zip(conds, exprs):
+            if cond:
+                return expr
+        return np.nan
+    pts = np.select([samples(c) for c in conds], [samples(e) for e in exprs], default=np.nan)
+    if any([isUncertain(e) for e in exprs]) or any([isUncertain(c) for c in conds]):
+        return uncertain(pts)
+    return pts
+
+
+def _compare(func):
+    def compare(a, b):
+        # Sample-wise outcome, not the probability mcerp comparisons return.
+        return func(samples(a), samples(b))
+    return compare
+
+
+BUILTINS = {
+    'umin': umin,
+    'umax': umax,
+    'ufloor': ufloor,
+    'uceiling': uceiling,
+    'upiecewise': upiecewise,
+    'uequal': _compare(np.equal),
+    'unot_equal': _compare(np.not_equal),
+    'uless': _compare(np.less),
+    'uless_equal': _compare(np.less_equal),
+    'ugreater': _compare(np.greater),
+    'ugreater_equal': _compare(np.greater_equal),
+}
+
+
+class UncertainNumPyPrinter(NumPyPrinter):
+    """ NumPy printer emitting the builtins above for Min, Max and Piecewise.
+
+    Summation and product bounds are truncated to integers.
+
+    Relations inside Piecewise conditions are compared per sample, elsewhere
+    they keep the NumPy semantics.
+    """
+
+    kRELATIONS = {'==': 'uequal', '!=': 'unot_equal', '<': 'uless', '<=': 'uless_equal',
+                  '>': 'ugreater', '>=': 'ugreater_equal'}
+
+    def __init__(self, settings=None):
+        super(UncertainNumPyPrinter, self).__init__(settings)
+        self._in_cond = False
+
+    @classmethod
+    def forModules(cls, modules):
+        """ Printer configured the way lambdify configures its own for modules.
+        """
+        user_functions = {}
+        for m in modules[::-1]:
+            if isinstance(m, dict):
+                for k in m:
+                    user_functions[k] = k
+        return cls({'fully_qualified_modules': False, 'inline': True,
+                    'allow_unknown_functions': True, 'user_functions': user_functions})
+
+    def _print_Float(self, expr):
+        # Doubles print in full, 15 digits would lose folded constants' last bits.
+        if expr._prec <= 53:
+            return repr(float(expr))
+        return super(UncertainNumPyPrinter, self)._print_Float(expr)
+
+    def _loops(self, expr):
+        # Bounds may be scaled by unit rates, hence floats.
+        return ' '.join(['for {} in range(int({}), int({})+1)'.format(
+            self._print(i), self._print(a), self._print(b)) for i, a, b in expr.limits])
+
+    def _print_Sum(self, expr):
+        return '(builtins.sum([{} {}]))'.format(self._print(expr.function), self._loops(expr))
+
+    def _print_Product(self, expr):
+        return '(prod([{} {}]))'.format(self._print(expr.function), self._loops(expr))
+
+    def _print_Min(self, expr):
+        return 'umin({})'.format(', '.join([self._print(a) for a in expr.args]))
+
+    def _print_Max(self, expr):
+        return 'umax({})'.format(', '.join([self._print(a) for a in expr.args]))
+
+    def _print_Piecewise(self, expr):
+        exprs = ', '.join([self._print(arg.expr) for arg in expr.args])
+        in_cond, self._in_cond = self._in_cond, True
+        try:
+            conds = ', '.join([self._print(arg.cond) for arg in expr.args])
+        finally:
+            self._in_cond = in_cond
+        return 'upiecewise([{}], [{}])'.format(conds, exprs)
+
+    def _print_Relational(self, expr):
+        if self._in_cond and expr.rel_op in self.kRELATIONS:
+            return '{}({}, {})'.format(self.kRELATIONS[expr.rel_op],
+                                       self._print(expr.lhs), self._print(expr.rhs))
+        return super(UncertainNumPyPrinter, self)._print_Relational(expr)
@@ -7,11 +7,20 @@ from ipykernel.kernelbase import Kernel
 
 from .interpreter.parser import Program
 
-args = namedtuple('arg', ['verbose', 'z3core', 'draw', 'mcsamples'])
+args = namedtuple('arg', ['verbose', 'z3core', 'draw', 'mcsamples', 'vectorize', 'jobs', 'no_cache', 'fuse',
+                           'dump_fused', 'no_cse', 'smt_timeout', 'smt_encoding'])
 args.verbose = False
 args.z3core = True
 args.draw = False
 args.mcsamples = 100
+args.vectorize = False
+args.jobs = 1
+args.no_cache = False
+args.fuse = False
+args.dump_fused = None
+args.no_cse = False
+args.smt_timeout = None
+args.smt_encoding = 'auto'
 kernel = True
 
 
@@ -1,5 +1,6 @@
 import logging
 import re
+from copy import copy
 from random import uniform
 
 from pint import UnitRegistry, DimensionalityError
@@ -44,6 +45,9 @@ class Names(object):
     summation = 'Sum'
     max_func = 'Max'
     min_func = 'Min'
+    maximize = 'max'
+    minimize = 'min'
+    pareto = 'pareto'
     target = 'to_solve'
     typeBody = 'type_body'
     typeDef = 'type_def'
@@ -74,6 +78,7 @@ class IdObject(object):
     """ Object with monotonically incrementing ID.
     """
 
+    __slots__ = ('id',)
     iid = 0
 
     def __init__(self):
@@ -85,6 +90,8 @@ class IdObject(object):
 
 
 class Node(IdObject):
+    __slots__ = ()
+
     def __init__(self):
         super(Node, self).__init__()
 
@@ -367,6 +374,9 @@ class LetNode(Node):
 
 class SolveNode(Node):
     """ Explore node.
+
+    Targets preceded by min or max are objectives, in priority order, optimized
+    jointly if the statement starts with pareto.
     """
 
     def __init__(self, toks):
@@ -378,6 +388,9 @@ class SolveNode(Node):
         dump_str = indent + '[{}] SolveNode:\n'.format(self.id)
         for t in self.targets:
             dump_str += indent + '\t{}\n'.format(t)
+        for t, minimize in self.objectives:
+            dump_str += indent + '\t{} {}{}\n'.format(Names.minimize if minimize else Names.maximize, t,
+                                                      ' ({})'.format(Names.pareto) if self.pareto else '')
         if (printable):
             print(dump_str)
         return dump_str
@@ -386,7 +399,18 @@ class SolveNode(Node):
         assert Names.solve in self.toks
         solve_stmt = self.toks[Names.solve][0]
         assert Names.target in solve_stmt
-        self.targets = solve_stmt[Names.target]
+        self.targets = []
+        self.objectives = []  # (target, minimize)
+        self.pareto = Names.pareto in solve_stmt
+        direction = None
+        for t in solve_stmt[Names.target]:
+            if t in (Names.minimize, Names.maximize):
+                direction = t
+                continue
+            self.targets.append(t)
+            if direction is not None:
+                self.objectives.append((t, direction == Names.minimize))
+                direction = None
 
 
 class PlotNode(Node):
@@ -447,14 +471,24 @@ class Relation(Node):
         def calc_rate(unit):
             return float(unit.to_base_units() / unit.to_base_units().units)
 
-        for t in toks:
-            if t in self.alias:
-                self.toks.append('( {} * {} )'.format(a2n[t], calc_rate(n2u[a2n[t]])))
+        # Indexed references are scaled after the index: ( X[i] * rate ).
+        closing = []
+        depth = 0
+        for i, t in enumerate(toks):
+            name = a2n[t] if t in self.alias else (t if t in self.names else None)
+            if name is not None and i + 1 < len(toks) and toks[i + 1] == '[':
+                self.toks.append('( {}'.format(name))
+                closing.append((depth, ' * {} )'.format(calc_rate(n2u[name]))))
+            elif name is not None:
+                self.toks.append('( {} * {} )'.format(name, calc_rate(n2u[name])))
             else:
-                if t in self.names:
-                    self.toks.append('( {} * {} )'.format(t, calc_rate(n2u[t])))
-                else:
-                    self.toks.append(t)
+                self.toks.append(t)
+                if t == '[':
+                    depth += 1
+                elif t == ']':
+                    depth -= 1
+                    if closing and closing[-1][0] == depth:
+                        self.toks.append(closing.pop()[1])
         self.str = ''.join(self.toks)
         unit_expression = self.str
         for name in VAR_NAME.findall(unit_expression):
@@ -470,14 +504,26 @@ class Relation(Node):
         #except DimensionalityError as e:
         #    logging.error("Units incompatible in equation {}\nError message:{}".format(self.orig, e))
 
+    def clone(self):
+        """ Copy for a name clone, only the names and tokens subs rewrites are not shared.
+        """
+        rel = copy(self)
+        rel.names = set(self.names)
+        rel.toks = list(self.toks)
+        return rel
+
     def subs(self, ext_name):
         base_name = ext_name[:ext_name.find(Names.clone_ext)]
         assert base_name in self.names and not ext_name in self.names, ext_name
         self.names.remove(base_name)
         self.names.add(ext_name)
+        # Names are emitted as '( name * rate )', or '( name' before an index.
+        prefix = '( {}'.format(base_name)
         for i in range(len(self.toks)):
             if self.toks[i] == base_name:
                 self.toks[i] = ext_name
+            elif self.toks[i] == prefix or self.toks[i].startswith(prefix + ' '):
+                self.toks[i] = '( {}'.format(ext_name) + self.toks[i][len(prefix):]
         self.str = ''.join(self.toks)
 
     def dump(self, indent='', printable=True):
@@ -0,0 +1,156 @@
+""" Simultaneous solving of strongly connected blocks of equations.
+"""
+
+import logging
+
+import numpy as np
+from scipy.optimize import root
+from sympy import Matrix
+from sympy.utilities.lambdify import lambdify
+
+from Charm.base.helpers import SympyHelper
+from Charm.base.uncertain_math import isUncertain, samples, uncertain
+
+
+def _stack(vals, shape):
+    """ Nested lists of scalars and arrays as one float array of trailing shape.
+    """
+    if isinstance(vals, (list, tuple)):
+        return np.array([_stack(v, shape) for v in vals])
+    return np.broadcast_to(np.asarray(vals, dtype=float), shape)
+
+
+def _maxabs(x):
+    return np.abs(x).max(axis=0)
+
+
+class AlgebraicLoop(object):
+    """ Equations depending on each other's outputs, solved as one system.
+
+    The residuals (lhs - rhs) and their Jacobian are derived symbolically
+    once. Newton iterations, with step halving, run on all points of a batch
+    at once; points that do not converge are retried one by one with MINPACK's
+    hybr. Each solve is seeded from the previous solution, so consecutive
+    sweep points follow the same branch of roots.
+
+    An instance is called like any step function, with the params values and
+    the previous solution, None if there is none, and returns the tuple of
+    unknowns values. It keeps no state of its own, the caller keeps the
+    solution, so runs sharing the instance do not seed each other.
+
+    Fields:
+        nodes: equation nodes of the block, by output name.
+        unknowns: names of the variables the block produces, one per equation.
+        params: names of the variables read from outside the block.
+    """
+
+    kMAX_ITER = 50
+    kMAX_HALVINGS = 8
+    kTOL = 1e-10
+
+    def __init__(self, nodes, modules, printer=None):
+        # Ordered by output name, so the initial guess does not depend on graph order.
+        self.nodes = sorted(nodes, key=lambda n: n.out_name)
+        self.unknowns = [n.out_name for n in self.nodes]
+        names = set()
+        for n in self.nodes:
+            names.update(n.val.names)
+        self.params = sorted(names - set(self.unknowns))
+        syms = SympyHelper.initSyms(sorted(names))
+        self.residuals = []
+        for n in self.nodes:
+            eq = SympyHelper.initExprs([n.val.str], syms)[0]
+            self.residuals.append(eq.lhs - eq.rhs)
+        unknowns = [syms[name] for name in self.unknowns]
+        args = unknowns + [syms[name] for name in self.params]
+        self.jacobian = Matrix(self.residuals).jacobian(unknowns)
+        self.f = lambdify(args, self.residuals, modules=modules, printer=printer)
+        self.j = lambdify(args, self.jacobian.tolist(), modules=modules, printer=printer)
+        logging.debug('Algebraic loop over {} given {}'.format(self.unknowns, self.params))
+
+    def __call__(self, *args):
+        params, guess = args[:-1], args[-1]
+        is_uncertain = any([isUncertain(p) for p in params])
+        pts = [np.asarray(samples(p), dtype=float) for p in params]
+        shape = np.broadcast_shapes(*[p.shape for p in pts])
+        x = self.initial(shape, guess)
+        with np.errstate(all='ignore'):
+            x, done = self.newton(x, pts, shape)
+            if not done.all():
+                self.hybr(x, pts, shape, done)
+        if is_uncertain:
+            return tuple([uncertain(v) for v in x])
+        return tuple([v if v.ndim else v[()] for v in x])
+
+    def initial(self, shape, guess=None):
+        # Distinct values, a symmetric start often has a singular Jacobian.
+        default = np.array([np.full(shape, 1. + .1 * k) for k in range(len(self.unknowns))])
+        if guess is None:
+            return default
+        try:
+            guess = np.array([np.broadcast_to(np.asarray(samples(g), dtype=float), shape) for g in guess])
+        except (TypeError, ValueError):
+            return default
+        return np.where(np.isfinite(guess), guess, default)
+
+    def residual(self, x, pts, shape):
+        return _stack(self.f(*(list(x) + pts)), shape)
+
+    def newton(self, x, pts, shape):
+        """ Damped Newton iterations on all points at once.
+
+        Returns the iterates and the mask of converged points.
+        """
+        f = self.residual(x, pts, shape)
+        norm = _maxabs(f)
+        done = norm <= self.kTOL
+        active = ~done & np.isfinite(norm)
+        for _ in range(self.kMAX_ITER):
+            if not active.any():
+                break
+            jac = np.moveaxis(_stack(self.j(*(list(x) + pts)), shape), (0, 1), (-2, -1))
+            rhs = np.moveaxis(f, 0, -1)[..., None]
+            try:
+                dx = np.linalg.solve(jac, rhs)[..., 0]
+            except np.linalg.LinAlgError:
+                dx = np.matmul(np.linalg.pinv(jac), rhs)[..., 0]
+            dx = np.moveaxis(dx, -1, 0)
+            step = np.ones(shape)
+            for _ in range(self.kMAX_HALVINGS):
+                cand = np.where(active, x - step * dx, x)
+                fc = self.residual(cand, pts, shape)
+                nc = _maxabs(fc)
+                worse = active & ~(nc < norm)
+                if not worse.any():
+                    break
+                step = np.where(worse, step / 2, step)
+            accept = active & (nc < norm)
+            small = _maxabs(step * dx) <= self.kTOL * (1 + _maxabs(x))
+            x = np.where(accept, cand, x)
+            f = np.where(accept, fc, f)
+            norm = np.where(accept, nc, norm)
+            done = done | (accept & ((norm <= self.kTOL) | small))
+            # Points that cannot make progress are left to hybr.
+            active = accept & ~done
+        return x, done
+
+    def hybr(self, x, pts, shape, done):
+        """ Solves the points not in done one by one, in place, nan where it fails.
+        """
+        failed = 0
+        pts = [np.broadcast_to(p, shape) for p in pts]
+        default = self.initial(())
+        for idx in zip(*np.nonzero(~done)) if shape else [()]:
+            point = [p[idx] for p in pts]
+            x0 = x[(slice(None),) + idx]
+            if not np.isfinite(x0).all():
+                x0 = default
+            sol = root(lambda u: _stack(self.f(*(list(u) + point)), ()),
+                       x0, jac=lambda u: _stack(self.j(*(list(u) + point)), ()), method='hybr')
+            if sol.success:
+                x[(slice(None),) + idx] = sol.x
+            else:
+                x[(slice(None),) + idx] = np.nan
+                failed += 1
+        if failed:
+            logging.warning('Algebraic loop {}: no solution found for {} point(s)'.format(self.unknowns, failed))
@@ -0,0 +1,103 @@
+""" Whole-model code generation: one straight-line Python function per plan.
+"""
+
+import logging
+
+from sympy.printing.pycode import NumPyPrinter
+from sympy.utilities.lambdify import lambdify
+
+from .execution_plan import slotSymbol, unwrap
+
+# Compiled code objects by source, shared by all models in the process.
+_code_cache = {}
+
+
+class FusedModel(object):
+    """ Fuses all steps and constraints of an ExecutionPlan into one function.
+
+    Every slot becomes a local variable; steps with a symbolic expression
+    are inlined as assignments in topological order, the remaining ones
+    (scripted and vector relations) are called through the namespace. The generated
+    function reads inputs from and writes outputs to a plan state, and
+    returns the tuple of constraint values.
+
+    Fields:
+        source: generated Python source.
+        func: compiled function, func(state) -> tuple of constraint values.
+    """
+
+    kFUNC_NAME = 'charm_model'
+
+    def __init__(self, plan, modules, printer=None):
+        # Reuse the namespace lambdify builds for the same modules, so inlined
+        # expressions resolve to the very functions node.func would call.
+        self.namespace = dict(lambdify((), 0, modules=modules).__globals__)
+        self.namespace['_unwrap'] = unwrap
+        if printer is None:
+            user_functions = {}
+            for m in modules[::-1]:
+                if isinstance(m, dict):
+                    for k in m:
+                        user_functions[k] = k
+            printer = NumPyPrinter({'fully_qualified_modules': False, 'inline': True,
+                                    'allow_unknown_functions': True,
+                                    'user_functions': user_functions})
+        self.printer = printer
+        self.source = self.generate(plan)
+        for mod, keys in (getattr(self.printer, 'module_imports', None) or {}).items():
+            for k in keys:
+                if k not in self.namespace:
+                    exec('from {} import {}'.format(mod, k), {}, self.namespace)
+        if self.source not in _code_cache:
+            _code_cache[self.source] = compile(self.source, '<charm-fused>', 'exec')
+        exec(_code_cache[self.source], self.namespace)
+        self.func = self.namespace[self.kFUNC_NAME]
+
+    def printExpr(self, expr):
+        try:
+            return self.printer.doprint(expr)
+        except Exception as e:
+            logging.debug('Fused: cannot inline {} ({})'.format(expr, e))
+            return None
+
+    def generate(self, plan):
+        local = lambda slot: str(slotSymbol(slot))
+        lines = ['def {}(state):'.format(self.kFUNC_NAME)]
+        # Slots read before any step writes them, e.g. the previous solution of a loop.
+        read, produced = set(), set()
+        for _, args, out in plan.steps:
+            read.update(set(args) - produced)
+            produced.add(out)
+        for _, args in plan.constraints:
+            read.update(set(args) - produced)
+        for slot in sorted(read):
+            lines.append('    {} = state[{}]  # {}'.format(local(slot), slot, plan.names[slot]))
+        for i, ((func, args, out), node, expr) in enumerate(zip(plan.steps, plan.step_nodes, plan.exprs)):
+            lines.append('    # {}'.format(node.val.str if node is not None else plan.names[out]))
+            code = None if expr is None else self.printExpr(expr)
+            if code is None:
+                self.namespace['_f{}'.format(i)] = func
+                code = '_unwrap(_f{}({}))'.format(i, ', '.join([local(a) for a in args]))
+            lines.append('    {} = {}'.format(local(out), code))
+            lines.append('    state[{}] = {}'.format(out, local(out)))
+        cons = []
+        for i, ((func, args), node, expr) in enumerate(zip(plan.constraints, plan.con_nodes, plan.con_exprs)):
+            if not set(args) <= plan.available:
+                # Constraints on values that are never computed always fail.
+                cons.append('False')
+                continue
+            lines.append('    # {}'.format(node.val.str))
+            code = None if expr is None else self.printExpr(expr)
+            if code is None:
+                self.namespace['_c{}'.format(i)] = func
+                code = '_c{}({})'.format(i, ', '.join([local(a) for a in args]))
+            lines.append('    _k{} = {}'.format(i, code))
+            cons.append('_k{}'.format(i))
+        lines.append('    return ({})'.format(''.join([c + ', ' for c in cons])))
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        with open(path, 'w') as ofile:
+            ofile.write(self.source)
+            ofile.close()
+        logging.info('Fused model written to {}'.format(path))
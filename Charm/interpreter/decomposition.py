@@ -0,0 +1,71 @@
+""" Dulmage-Mendelsohn decomposition of a model.
+"""
+
+import logging
+from collections import deque
+
+
+class Decomposition(object):
+    """ Splits the variable/equation bipartite graph by a maximum matching.
+
+    Variables and equations reachable through alternating paths from an
+    unmatched variable form the under-determined part, those reachable from
+    an unmatched equation the over-determined part. The remaining ones are
+    perfectly matched, the well-determined part. The three parts are
+    disjoint and do not depend on which maximum matching is used.
+
+    Fields:
+        match: node -> matched node, in both directions.
+        under_vars, under_eqs: under-determined part, unmatched variables included.
+        over_vars, over_eqs: over-determined part, unmatched equations included.
+        well_vars, well_eqs: well-determined part.
+    """
+
+    def __init__(self, graph, variables, match, id_node_map):
+        """ graph: networkx bipartite graph on node ids, variables: ids of the
+        variable side, match: maximum matching on ids.
+        """
+        self.match = dict([(id_node_map[a], id_node_map[b]) for a, b in match.items()])
+        equations = set(graph) - set(variables)
+        under = self.__alternate(graph, [v for v in variables if v not in match], match)
+        over = self.__alternate(graph, [e for e in equations if e not in match], match)
+        assert not under & over
+        well = set(graph) - under - over
+        side = lambda ids, is_var: set([id_node_map[i] for i in ids if (i in variables) == is_var])
+        self.under_vars, self.under_eqs = side(under, True), side(under, False)
+        self.over_vars, self.over_eqs = side(over, True), side(over, False)
+        self.well_vars, self.well_eqs = side(well, True), side(well, False)
+
+    @staticmethod
+    def __alternate(graph, roots, match):
+        """ Nodes on alternating paths from the unmatched roots: any edge away
+        from the roots' side, matched edges back to it.
+        """
+        seen = set(roots)
+        q = deque(roots)
+        while q:
+            cur = q.popleft()
+            for nb in graph.neighbors(cur):
+                if nb in seen:
+                    continue
+                seen.add(nb)
+                mate = match.get(nb)
+                if mate is not None and mate not in seen:
+                    seen.add(mate)
+                    q.append(mate)
+        return seen
+
+    def isDetermined(self):
+        return not self.under_vars
+
+    def dump(self):
+        logging.info('Decomposition: well-determined {} variables / {} equations, '
+                     'over-determined {} / {}, under-determined {} / {}'.format(
+                         len(self.well_vars), len(self.well_eqs), len(self.over_vars), len(self.over_eqs),
+                         len(self.under_vars), len(self.under_eqs)))
+        if self.under_vars:
+            logging.info('\tUnder-determined: {}'.format(sorted([n.val for n in self.under_vars])))
+        unmatched = [n for n in self.over_eqs if n not in self.match]
+        if unmatched:
+            logging.info('\tRedundant, checked as constraints:\n\t\t{}'.format(
+                '\n\t\t'.join([n.val.str for n in unmatched])))
@@ -0,0 +1,160 @@
+""" Persistent on-disk cache of symbolically solved relations.
+"""
+
+import ast
+import hashlib
+import logging
+import os
+import time
+
+import sympy
+from sympy import Basic, srepr
+from sympy.core.function import FunctionClass
+from sympy.functions.elementary.piecewise import ExprCondPair
+
+
+def _srepr_names():
+    """ Sympy classes, functions and singletons srepr output may refer to.
+    """
+    names = {}
+    exec('from sympy import *', names)
+    names['ExprCondPair'] = ExprCondPair
+    return dict([(k, v) for k, v in names.items()
+                 if isinstance(v, (Basic, FunctionClass)) or (isinstance(v, type) and issubclass(v, Basic))])
+
+
+kSREPR_NAMES = _srepr_names()
+
+
+def fromSrepr(text):
+    """ Sympy expression of its srepr text, without evaluating any code: only
+    calls of sympy classes on literals and other such calls are accepted.
+    """
+
+    def load(node):
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Constant):
+            return -node.operand.value
+        if isinstance(node, ast.Tuple):
+            return tuple([load(e) for e in node.elts])
+        if isinstance(node, ast.List):
+            return [load(e) for e in node.elts]
+        if isinstance(node, ast.Name) and node.id in kSREPR_NAMES:
+            return kSREPR_NAMES[node.id]
+        if isinstance(node, ast.Call):
+            func = load(node.func)
+            if not isinstance(func, FunctionClass) and not (isinstance(func, type) and issubclass(func, Basic)):
+                raise ValueError('Not a sympy class: {}'.format(ast.dump(node.func)))
+            return func(*[load(a) for a in node.args], **dict([(k.arg, load(k.value)) for k in node.keywords]))
+        raise ValueError('Unexpected srepr syntax: {}'.format(ast.dump(node)))
+
+    return load(ast.parse(text.strip(), mode='eval').body)
+
+
+def default_cache_dir():
+    if os.environ.get('CHARM_CACHE_DIR'):
+        return os.environ['CHARM_CACHE_DIR']
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'charm')
+
+
+class EquationCache(object):
+    """ Content-addressed store of solved sympy expressions.
+
+    Each entry is one file named after the hash of its key and holding the
+    srepr of the expression, read back by fromSrepr. Hits refresh the file time, so eviction drops
+    the least recently used entries first. Any I/O failure is logged and
+    treated as a miss, the cache never fails a run.
+
+    Fields:
+        path: cache directory.
+        max_size: bytes kept on disk after eviction.
+        max_age: seconds an unused entry is kept.
+    """
+
+    kSUFFIX = '.expr'
+
+    def __init__(self, path=None, max_size=64 * 1024 * 1024, max_age=30 * 24 * 3600):
+        self.path = path or default_cache_dir()
+        self.max_size = max_size
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, *parts):
+        h = hashlib.sha256()
+        # Solutions may differ between sympy versions.
+        h.update(repr((sympy.__version__,) + parts).encode('utf-8'))
+        return h.hexdigest()
+
+    def __file(self, key):
+        return os.path.join(self.path, key + self.kSUFFIX)
+
+    def get(self, key):
+        try:
+            with open(self.__file(key), 'r') as ifile:
+                expr = fromSrepr(ifile.read())
+            os.utime(self.__file(key))
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        except Exception as e:
+            logging.debug('Equation cache: dropping unreadable entry {} ({})'.format(key, e))
+            self.remove(key)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return expr
+
+    def put(self, key, expr):
+        tmp = self.__file(key) + '.{}.tmp'.format(os.getpid())
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            with open(tmp, 'w') as ofile:
+                ofile.write(srepr(expr))
+            os.replace(tmp, self.__file(key))
+        except (IOError, OSError) as e:
+            logging.debug('Equation cache: cannot write {} ({})'.format(self.path, e))
+
+    def remove(self, key):
+        try:
+            os.remove(self.__file(key))
+        except (IOError, OSError):
+            pass
+
+    def cached(self, parts, compute):
+        """ Returns the expression stored for parts, computing and storing it on a miss.
+        """
+        key = self.key(*parts)
+        expr = self.get(key)
+        if expr is None:
+            expr = compute()
+            self.put(key, expr)
+        return expr
+
+    def evict(self):
+        """ Drops entries older than max_age, then the oldest ones until under max_size.
+        """
+        try:
+            names = [n for n in os.listdir(self.path) if n.endswith(self.kSUFFIX)]
+        except (IOError, OSError):
+            return
+        now = time.time()
+        entries = []
+        for n in names:
+            try:
+                st = os.stat(os.path.join(self.path, n))
+            except (IOError, OSError):
+                continue
+            if now - st.st_mtime > self.max_age:
+                self.remove(n[:-len(self.kSUFFIX)])
+            else:
+                entries.append((st.st_mtime, st.st_size, n))
+        total = sum([e[1] for e in entries])
+        for _, size, n in sorted(entries):
+            if total <= self.max_size:
+                break
+            self.remove(n[:-len(self.kSUFFIX)])
+            total -= size
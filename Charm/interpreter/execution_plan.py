@@ -0,0 +1,391 @@
+""" Flat execution plan compiled from a functional graph.
+"""
+
+import logging
+import operator
+
+from sympy import Indexed, IndexedBase, Mul, Symbol, cse, numbered_symbols
+from sympy.utilities.lambdify import lambdify
+
+from .graph import NodeType
+
+
+def unwrap(val):
+    """ Single element tuples and lists are evaluated as scalars.
+    """
+    if (isinstance(val, tuple) or isinstance(val, list)) and len(val) == 1:
+        return val[0]
+    return val
+
+
+def _isUnit(a):
+    return a.is_Float and a == 1
+
+
+def dropUnitFactors(expr):
+    """ expr without multiplications by 1.0, e.g. the float conversions ( x * 1.0 ) of relations.
+    """
+    return expr.replace(lambda e: e.is_Mul and any([_isUnit(a) for a in e.args]),
+                        lambda e: Mul(*[a for a in e.args if not _isUnit(a)]))
+
+
+def slotSymbol(slot):
+    return Symbol('_v{}'.format(slot))
+
+
+class ExecutionPlan(object):
+    """ Linear schedule of a functional graph.
+
+    Every variable owns a slot in a flat state list. Equations become steps,
+    in topological order, that read their arguments from slots and write their
+    output slot. Constraints read slots only and are checked after the steps,
+    or, by CheckedRun, right after their last input is computed.
+
+    Fields:
+        names: slot -> variable name.
+        n2s: variable name -> slot.
+        inputs: slots of input nodes.
+        vectors: slots of vector variables, evaluated as arrays.
+        steps: (func, argument slots, output slot) in topological order.
+        step_nodes: step -> equation node, None for shared subexpressions and loop solves.
+        exprs: step -> solution over slot symbols, None if not symbolic.
+        constraints: (func, argument slots).
+        con_nodes: constraint -> constraint node.
+        con_given: constraint -> names of its argument slots.
+        con_exprs: constraint -> expression over slot symbols, None if not symbolic.
+        available: slots holding a value once the steps ran.
+        fused: FusedModel evaluating steps and constraints at once, if any.
+    """
+
+    def __init__(self, graph, skip=(), folds=None):
+        """ Relation nodes in skip are left out of the plan. folds: node ->
+        (func, solution, given) replacing those of the node, see foldConstants.
+        """
+        folds = folds or {}
+        relation = lambda n: folds.get(n) or (n.func, n.solution, n.ordered_given)
+        skip = set(skip)
+        self.names = []
+        self.n2s = {}
+        self.inputs = []
+        self.vectors = set()
+        self.steps = []
+        self.step_nodes = []
+        self.exprs = []
+        self.constraints = []
+        self.con_nodes = []
+        self.con_given = []
+        self.con_exprs = []
+        self.readers = {}  # Slot -> steps reading it.
+        self.schedules = {}  # Changed slots -> steps to re-run.
+        self.con_pos = None  # Constraint -> last step computing one of its inputs, -1 for none.
+        self.checked_schedules = {}  # (changed, stale, unknown) -> steps and constraints to run.
+        self.fused = None
+        for n in graph.node_set:
+            if n.getType() == NodeType.VARIABLE or n.getType() == NodeType.INPUT:
+                self.n2s[n.val] = len(self.names)
+                self.names.append(n.val)
+                if n.vector:
+                    self.vectors.add(self.n2s[n.val])
+                if n.getType() == NodeType.INPUT:
+                    self.inputs.append(self.n2s[n.val])
+        available = set(self.inputs)
+        for block in graph.getTopologicalBlocks():
+            if set(block) & skip:
+                continue
+            if len(block) > 1:
+                self.addLoop(block, available)
+                continue
+            n = block[0]
+            func, solution, given = relation(n)
+            args = tuple([self.n2s[name] for name in given])
+            if not set(args) <= available:
+                logging.debug('Plan: {} is never evaluated, inputs unavailable'.format(n.val.str))
+                continue
+            out = self.n2s[n.out_name]
+            available.add(out)
+            self.addStep(func, args, out, n, self.slotExpr(solution, given))
+        for n in graph.getNextConNode():
+            if n in skip:
+                continue
+            func, solution, given = relation(n)
+            self.constraints.append((func, tuple([self.n2s[name] for name in given])))
+            self.con_nodes.append(n)
+            self.con_given.append(given)
+            self.con_exprs.append(self.slotExpr(solution, given))
+        self.available = available
+        for i, (_, args) in enumerate(self.constraints):
+            if not set(args) <= available:
+                self.con_exprs[i] = None
+        logging.debug('Plan: {} slots, {} steps, {} constraints'.format(
+            len(self.names), len(self.steps), len(self.constraints)))
+
+    def addStep(self, func, args, out, node=None, expr=None):
+        for a in args:
+            self.readers.setdefault(a, []).append(len(self.steps))
+        self.steps.append((func, args, out))
+        self.step_nodes.append(node)
+        self.exprs.append(expr)
+
+    def addLoop(self, block, available):
+        """ Schedules an algebraic loop: one step solves the block into a slot of
+        its own holding the tuple of solutions, one step per equation reads its output.
+        The solve step also reads its own slot, the solution of the previous point.
+        """
+        loop = block[0].loop
+        if loop is None:
+            logging.debug('Plan: loop over {} has no solver'.format([n.out_name for n in block]))
+            return
+        args = tuple([self.n2s[name] for name in loop.params])
+        if not set(args) <= available:
+            logging.debug('Plan: loop over {} is never evaluated, inputs unavailable'.format(loop.unknowns))
+            return
+        slot = len(self.names)
+        self.names.append('<loop {}>'.format(slot))
+        available.add(slot)
+        self.addStep(loop, args + (slot,), slot)
+        for k, n in enumerate(loop.nodes):
+            out = self.n2s[n.out_name]
+            available.add(out)
+            self.addStep(operator.itemgetter(k), (slot,), out, n)
+
+    def slotExpr(self, solution, given):
+        """ Solution over the given variables renamed to their slot symbols.
+        """
+        if solution is None or solution.atoms(Indexed, IndexedBase):
+            # Scripted and vector relations are only available as functions.
+            return None
+        subs = dict([(Symbol(name), slotSymbol(self.n2s[name])) for name in given])
+        if not solution.free_symbols <= set(subs):
+            # Refers to names that are not its inputs, kept as the function.
+            return None
+        return dropUnitFactors(solution.xreplace(subs))
+
+    def eliminateCommonSubexpressions(self, modules, printer=None):
+        """ Computes subterms shared by symbolic steps and constraints only once.
+
+        Every shared subterm gets a slot and a step of its own, scheduled right
+        before its first reader, and the readers are regenerated over it.
+        """
+        symbolic = [e for e in self.exprs + self.con_exprs if e is not None]
+        if not symbolic:
+            return 0
+        start = len(self.names)
+        replacements, reduced = cse(symbolic, symbols=numbered_symbols('_v', start=start))
+        if not replacements:
+            return 0
+        reduced = iter(reduced)
+        self.exprs = [e if e is None else next(reduced) for e in self.exprs]
+        self.con_exprs = [e if e is None else next(reduced) for e in self.con_exprs]
+        subs = {}
+        for sym, expr in replacements:
+            slot = len(self.names)
+            self.names.append('<cse {}>'.format(slot))
+            subs[sym] = (slot, expr)
+            self.available.add(slot)
+
+        def compile_expr(expr):
+            args = tuple(sorted([int(str(sym)[2:]) for sym in expr.free_symbols]))
+            return lambdify(tuple([slotSymbol(a) for a in args]), expr, modules=modules, printer=printer), args
+
+        steps, step_nodes, exprs = [], [], []
+        emitted = set()
+
+        def emit(expr):
+            # Shared subterms needed by expr go first, in dependency order.
+            for sym in sorted(expr.free_symbols, key=lambda x: int(str(x)[2:])):
+                if sym in subs and sym not in emitted:
+                    emitted.add(sym)
+                    slot, sub_expr = subs[sym]
+                    emit(sub_expr)
+                    func, args = compile_expr(sub_expr)
+                    steps.append((func, args, slot))
+                    step_nodes.append(None)
+                    exprs.append(sub_expr)
+
+        for (func, args, out), node, expr in zip(self.steps, self.step_nodes, self.exprs):
+            if expr is not None and expr.free_symbols & set(subs):
+                emit(expr)
+                func, args = compile_expr(expr)
+            steps.append((func, args, out))
+            step_nodes.append(node)
+            exprs.append(expr)
+        constraints = []
+        for (func, args), expr in zip(self.constraints, self.con_exprs):
+            if expr is not None and expr.free_symbols & set(subs):
+                emit(expr)
+                func, args = compile_expr(expr)
+            constraints.append((func, args))
+        self.steps, self.step_nodes, self.exprs = steps, step_nodes, exprs
+        self.constraints = constraints
+        self.readers = {}
+        for i, (_, args, _) in enumerate(self.steps):
+            for a in args:
+                self.readers.setdefault(a, []).append(i)
+        self.schedules = {}
+        self.con_pos = None
+        self.checked_schedules = {}
+        logging.debug('Plan: {} shared subexpressions'.format(len(replacements)))
+        return len(replacements)
+
+    def fuse(self, modules, printer=None):
+        """ Generates a single function for the whole plan, run() uses it from now on.
+        """
+        from .codegen import FusedModel
+        self.fused = FusedModel(self, modules, printer)
+        return self.fused
+
+    def newState(self):
+        return [None] * len(self.names)
+
+    def schedule(self, changed):
+        """ Steps to re-run, in order, after the slots in changed got new values.
+        """
+        key = frozenset(changed)
+        if key not in self.schedules:
+            cone = set()
+            stack = list(key)
+            while stack:
+                for i in self.readers.get(stack.pop(), []):
+                    if i not in cone:
+                        cone.add(i)
+                        stack.append(self.steps[i][2])
+            # Step indices follow the topological order.
+            self.schedules[key] = sorted(cone)
+        return self.schedules[key]
+
+    def run(self, state, changed=None):
+        """ Evaluates all steps, or only those downstream of changed slots.
+
+        Returns the constraint values if a fused run computed them, else None.
+        """
+        if self.fused is not None:
+            # Straight-line code is cheaper than scheduling the cone.
+            return self.fused.func(state)
+        steps = self.steps
+        if changed is None:
+            for func, args, out in steps:
+                state[out] = unwrap(func(*[state[a] for a in args]))
+        else:
+            for i in self.schedule(changed):
+                func, args, out = steps[i]
+                state[out] = unwrap(func(*[state[a] for a in args]))
+
+    def checkedSchedule(self, changed, stale, unknown):
+        """ Steps and constraints to run, in order, after the slots in changed got
+        new values: the cone of changed, the stale steps, and the constraints
+        reading a slot written by them or of unknown value. Each constraint comes
+        right after the step computing its last input.
+
+        Returns the list of (is_constraint, index) and the set of constraints in it.
+        """
+        key = (None if changed is None else frozenset(changed), frozenset(stale), frozenset(unknown))
+        if key not in self.checked_schedules:
+            if self.con_pos is None:
+                producer = dict([(out, i) for i, (_, _, out) in enumerate(self.steps)])
+                self.con_pos = [max([producer.get(a, -1) for a in args] + [-1]) for _, args in self.constraints]
+            if changed is None:
+                todo = set(range(len(self.steps)))
+                written = None
+            else:
+                todo = set(self.schedule(changed)) | set(stale)
+                written = set(changed) | set([self.steps[i][2] for i in todo])
+            cons = set([j for j, (_, args) in enumerate(self.constraints)
+                        if written is None or j in unknown or written.intersection(args)])
+            events = [(i, False, i) for i in todo] + [(self.con_pos[j], True, j) for j in cons]
+            events.sort()
+            self.checked_schedules[key] = ([(is_con, i) for _, is_con, i in events], cons)
+        return self.checked_schedules[key]
+
+    def constraintValues(self, state, con_vals=None):
+        """ Yields the value of every constraint, False when its inputs are missing.
+        con_vals: values returned by run(), if any.
+        """
+        if con_vals is not None:
+            for val in con_vals:
+                yield val
+            return
+        for func, args in self.constraints:
+            vals = [state[a] for a in args]
+            yield False if any(v is None for v in vals) else func(*vals)
+
+    def check(self, state, con_vals=None):
+        """ Evaluates all constraints, a constraint with missing inputs is violated.
+        con_vals: values returned by run(), if any.
+        """
+        for j, val in enumerate(self.constraintValues(state, con_vals)):
+            if not val:
+                self.logViolation(j, state)
+                return False
+        return True
+
+    def logViolation(self, j, state):
+        node = self.con_nodes[j]
+        vals = [state[a] for a in self.constraints[j][1]]
+        logging.log(logging.ERROR, 'VIOLATION: [{}] on:\n\t{}'.format(
+            node.val.str, dict(zip(self.con_given[j], vals))))
+
+
+class CheckedRun(object):
+    """ Evaluation of consecutive points of a plan, stopping at the first
+    violated constraint.
+
+    Constraints are checked as soon as their inputs are computed, and only
+    when one of their inputs changed since they were last checked. A point
+    violating a constraint skips the steps after it; they are stale and run
+    with the next point. A fused plan is run as a whole and checked after.
+
+    Fields:
+        plan: ExecutionPlan evaluated.
+        state: slot values of the current point.
+        stale: steps skipped by the last violation.
+        con_vals: last value of each constraint, None if unknown.
+        violated: constraint violated by the last point, None if it was feasible.
+    """
+
+    def __init__(self, plan, state):
+        self.plan = plan
+        self.state = state
+        self.stale = set()
+        self.con_vals = [None] * len(plan.constraints)
+        self.violated = None
+
+    def run(self, changed=None):
+        """ Evaluates the point after the slots in changed, all if None, got new
+        values. Returns whether it satisfies all constraints.
+        """
+        plan, state = self.plan, self.state
+        if plan.fused is not None:
+            return plan.check(state, plan.run(state, changed))
+        unknown = [j for j, val in enumerate(self.con_vals) if val is None]
+        events, cons = plan.checkedSchedule(changed, self.stale, unknown)
+        if self.violated is not None and self.violated not in cons:
+            # Still violated, nothing it reads changed.
+            for is_con, i in events:
+                if is_con:
+                    self.con_vals[i] = None
+                else:
+                    self.stale.add(i)
+            plan.logViolation(self.violated, state)
+            return False
+        steps, constraints = plan.steps, plan.constraints
+        for k, (is_con, i) in enumerate(events):
+            if not is_con:
+                func, args, out = steps[i]
+                state[out] = unwrap(func(*[state[a] for a in args]))
+                continue
+            func, args = constraints[i]
+            vals = [state[a] for a in args]
+            ok = bool(not any(v is None for v in vals) and func(*vals))
+            self.con_vals[i] = ok
+            if not ok:
+                self.violated = i
+                rest = events[k + 1:]
+                self.stale = set([j for is_con, j in rest if not is_con])
+                for is_con, j in rest:
+                    if is_con:
+                        self.con_vals[j] = None
+                plan.logViolation(i, state)
+                return False
+        self.violated = None
+        self.stale = set()
+        return True
@@ -2,7 +2,6 @@
 """
 
 from collections import deque
-from copy import copy, deepcopy
 
 import matplotlib.pyplot as plt
 import networkx as nx
@@ -41,6 +40,8 @@ class GraphEdge(IdObject):
     undirected edge should be refered using node1, node2.
     """
 
+    __slots__ = ('fixed', 'node1', 'node2', 'src', 'dst')
+
     def __init__(self, node1, node2, src=None, dst=None):
         super(GraphEdge, self).__init__()
         self.fixed = False
@@ -61,10 +62,14 @@ class GraphEdge(IdObject):
         self.src = src
         self.dst = dst
         self.fixed = fixed
+        self.node1.reindex(self)
+        self.node2.reindex(self)
 
     def reset(self):
         assert not self.fixed, 'Trying to reset fixed edge {}->{}'.format(self.src.id, self.dst.id)
         self.src = self.dst = None
+        self.node1.reindex(self)
+        self.node2.reindex(self)
 
     def isDirected(self):
         if self.src and self.dst:
@@ -86,8 +91,21 @@ class GraphEdge(IdObject):
         return (self.node1 is rhs.node1 and self.node2 is rhs.node2) or \
                (self.node1 is rhs.node2 and self.node2 is rhs.node1)
 
+    # Edges are indexed by id, equality above does not define identity.
+    __hash__ = IdObject.__hash__
+
 
 class GraphNode(Node):
+    """ Node of the dependency graph.
+
+    Edges are indexed by id, by neighbour id and, once directed, by direction,
+    so adjacency updates and queries take constant time.
+    """
+
+    __slots__ = ('type', 'vector', 'val', 'exts', '_edges', '_nbrs', 'in_edges', 'out_edges',
+                 'ordered_given', 'proped', 'marked', 'func', 'func_str', 'solution', 'loop', 'out_name',
+                 'out_val')
+
     def __init__(self, node_type, val):
         super(GraphNode, self).__init__()
         self.type = node_type
@@ -98,13 +116,22 @@ class GraphNode(Node):
         self.val = val
         # Set of name extensions on the node.
         self.exts = []
-        # Set of edges connecting the node.
-        self.edges = []
+        # Edges connecting the node: id -> edge, in insertion order.
+        self._edges = {}
+        # Neighbour id -> edge, there is at most one edge between two nodes.
+        self._nbrs = {}
+        # Directed edges ending and starting at the node: id -> edge.
+        self.in_edges = {}
+        self.out_edges = {}
         self.ordered_given = []
         self.proped = {}
         self.marked = False
         self.func = None
         self.func_str = None
+        # Sympy expression func was generated from, if any.
+        self.solution = None
+        # AlgebraicLoop solving the equation together with its block, if any.
+        self.loop = None
         # Output variable name.
         self.out_name = None
         # Output variable value.
@@ -128,7 +155,7 @@ class GraphNode(Node):
         node = GraphNode(self.type, None)
         node.marked = self.marked
         node.vector = self.vector
-        node.exts = deepcopy(self.exts)
+        node.exts = list(self.exts)
         node.addExtName(ext)
         for e in self.edges:
             nb = self.next(e)
@@ -150,17 +177,20 @@ class GraphNode(Node):
         if self.type == NodeType.VARIABLE:
             node.val = self.val + Names.clone_ext + ext
         elif self.type == NodeType.EQUATION or self.type == NodeType.CONSTRAINT:
-            node.val = deepcopy(self.val)
+            node.val = self.val.clone()
             ext_names = []
+            dummy_edges = []
             for e in node.edges:
                 nn = node.next(e)
-                if nn.getType() == NodeType.VARIABLE and nn.exts[-1] == ext:
-                    ext_names.append(nn.val)
-            dummy_edges = [e for e in node.edges if (node.next(e).getType() == NodeType.VARIABLE and
-                                                     node.next(e).exts[-1] != ext) or (
-                                   node.next(e).getType() == NodeType.INPUT and
-                                   (set(node.next(e).exts) & ext_set) and
-                                   (set(node.next(e).exts) & ext_set != ext))]
+                if nn.getType() == NodeType.VARIABLE:
+                    if nn.exts[-1] == ext:
+                        ext_names.append(nn.val)
+                    else:
+                        dummy_edges.append(e)
+                elif nn.getType() == NodeType.INPUT:
+                    exts = set(nn.exts) & ext_set
+                    if exts and exts != set([ext]):
+                        dummy_edges.append(e)
             for e in dummy_edges:
                 nn = node.next(e)
                 node.removeEdge(e)
@@ -181,14 +211,43 @@ class GraphNode(Node):
         """
         self.out_name = ostr
 
+    @property
+    def edges(self):
+        return list(self._edges.values())
+
+    def hasEdge(self, edge):
+        return edge.id in self._edges
+
+    def getEdgeTo(self, nb):
+        """ The edge connecting the neighbour nb, None if not adjacent.
+        """
+        return self._nbrs.get(nb.id)
+
     def addEdge(self, edge):
-        for e in self.edges:
-            assert not e == edge, 'Edge {} already exits'.format(e.getPrintable())
-        self.edges.append(edge)
+        nb = self.next(edge)
+        assert nb.id not in self._nbrs, 'Edge {} already exits'.format(self._nbrs[nb.id].getPrintable())
+        self._edges[edge.id] = edge
+        self._nbrs[nb.id] = edge
+        self.reindex(edge)
 
     def removeEdge(self, edge):
-        assert edge in self.edges
-        self.edges.remove(edge)
+        assert edge.id in self._edges
+        del self._edges[edge.id]
+        del self._nbrs[self.next(edge).id]
+        self.in_edges.pop(edge.id, None)
+        self.out_edges.pop(edge.id, None)
+
+    def reindex(self, edge):
+        """ Files edge under its current direction, called whenever it changes.
+        """
+        if edge.id not in self._edges:
+            return
+        self.in_edges.pop(edge.id, None)
+        self.out_edges.pop(edge.id, None)
+        if edge.dst is self:
+            self.in_edges[edge.id] = edge
+        elif edge.src is self:
+            self.out_edges[edge.id] = edge
 
     def getFlexibleEdges(self):
         flexible = []
@@ -224,70 +283,73 @@ class GraphNode(Node):
 
     def has_conflict(self):
         if self.type == NodeType.VARIABLE:
-            indegree = 0
-            for e in self.edges:
-                if e.isDirected() and e.dst is self:
-                    indegree += 1
+            indegree = len(self.in_edges)
             if indegree != 1:
                 return True, indegree
         elif self.type == NodeType.EQUATION:
-            outdegree = 0
-            for e in self.edges:
-                if e.isDirected() and e.src is self:
-                    outdegree += 1
+            outdegree = len(self.out_edges)
             if outdegree > 1:
                 return True, outdegree
         elif self.type == NodeType.CONSTRAINT:
-            outdegree = 0
-            for e in self.edges:
-                if e.isDirected() and e.src is self:
-                    outdegree += 1
+            outdegree = len(self.out_edges)
             if outdegree > 0:
                 return True, outdegree
         else:
             assert self.type == NodeType.INPUT
-            indegree = 0
-            for e in self.edges:
-                if e.isDirected() and e.dst is self:
-                    indegree += 1
+            indegree = len(self.in_edges)
             if indegree > 0:
                 return True, indegree
         return False, None
 
 
 class Graph(object):
+    """ Nodes and edges indexed by id, iterated in insertion order.
+    """
+
     def __init__(self, drawable=False):
-        self.node_set = []
-        self.edge_set = []
+        self.nodes = {}
+        self.edges = {}
         self.drawable = drawable
 
+    @property
+    def node_set(self):
+        return list(self.nodes.values())
+
+    @property
+    def edge_set(self):
+        return list(self.edges.values())
+
+    def hasNode(self, node):
+        return node.id in self.nodes
+
+    def hasEdge(self, edge):
+        return edge.id in self.edges
+
     def addNode(self, node):
-        assert node not in self.node_set
-        self.node_set.append(node)
+        assert node.id not in self.nodes
+        self.nodes[node.id] = node
 
     def removeNode(self, node):
-        assert node in self.node_set
-        edges = copy(node.edges)
-        for e in edges:
+        assert node.id in self.nodes
+        for e in node.edges:
             self.removeEdge(e)
-        self.node_set.remove(node)
+        del self.nodes[node.id]
 
     def addEdge(self, edge):
-        assert edge not in self.edge_set
-        self.edge_set.append(edge)
+        assert edge.id not in self.edges
+        self.edges[edge.id] = edge
 
     def removeEdge(self, edge):
         """ When removing edge, remove from both endpoints.
         """
-        assert edge in self.edge_set
+        assert edge.id in self.edges
         edge.node1.removeEdge(edge)
         edge.node2.removeEdge(edge)
-        self.edge_set.remove(edge)
+        del self.edges[edge.id]
 
     def addEdges(self, edges):
         for edge in edges:
-            assert not edge in self.edge_set
-            self.edge_set.append(edge)
+            self.addEdge(edge)
 
     def getUnmarkedNode(self):
         for n in self.node_set:
@@ -309,69 +371,89 @@ class Graph(object):
             if n.getType() == NodeType.CONSTRAINT or n.getType() == NodeType.EQUATION:
                 yield n
 
+    def getTopologicalBlocks(self):
+        """ Equation nodes of a functional graph grouped into strongly connected
+        blocks, ordered so that every block comes after the blocks producing its inputs.
+
+        A block of more than one equation is an algebraic loop: its equations
+        depend on each other's outputs and must be solved simultaneously.
+        """
+        eqs = list(self.getNextEqNode())
+        producer = {}
+        for n in eqs:
+            for e in n.out_edges.values():
+                producer[e.dst] = n
+        deps = nx.DiGraph()
+        deps.add_nodes_from(eqs)
+        for n in eqs:
+            for e in n.in_edges.values():
+                if e.src in producer:
+                    deps.add_edge(producer[e.src], n)
+        position = dict([(n, i) for i, n in enumerate(eqs)])
+        blocks = sorted([sorted(c, key=position.get) for c in nx.strongly_connected_components(deps)],
+                        key=lambda b: position[b[0]])
+        block_of = {}
+        for i, b in enumerate(blocks):
+            for n in b:
+                block_of[n] = i
+        indegree = [0] * len(blocks)
+        users = {}
+        for u, v in deps.edges():
+            if block_of[u] != block_of[v]:
+                indegree[block_of[v]] += 1
+                users.setdefault(block_of[u], []).append(block_of[v])
+        ready = deque([i for i in range(len(blocks)) if not indegree[i]])
+        order = []
+        while ready:
+            cur = ready.popleft()
+            order.append(blocks[cur])
+            for i in users.get(cur, []):
+                indegree[i] -= 1
+                if not indegree[i]:
+                    ready.append(i)
+        return order
+
     def connected(self, src, dst):
         """ If connected in a directed graph.
         """
-        nodes = deque()
-        nodes.append(src)
-        idx = 0
-        while idx < len(nodes):
-            cur = nodes[idx]
-            if src is dst:
+        nodes = deque([src])
+        seen = set([src.id])
+        while nodes:
+            cur = nodes.popleft()
+            if cur is dst:
                 return True
-            for e in cur.edges:
-                if not cur.next(e) in nodes:
-                    nodes.append(cur.next(e))
-            idx += 1
+            for e in cur.out_edges.values():
+                if e.dst.id not in seen:
+                    seen.add(e.dst.id)
+                    nodes.append(e.dst)
         return False
 
     def isConnected(self, node1, node2):
-        connected = set()
-        q = deque()
-        q.append(node1)
-        connected.add(node1)
+        """ If connected in the undirected graph.
+        """
+        seen = set([node1.id])
+        q = deque([node1])
         while q:
             cur = q.popleft()
+            if cur is node2:
+                return True
             for e in cur.edges:
                 nb = cur.next(e)
-                if not nb in connected:
+                if nb.id not in seen:
+                    seen.add(nb.id)
                     q.append(nb)
-                connected.add(nb)
-        return node2 in connected
+        return False
 
     def hasPath(self, src, dst):
         """ If has a path in directed graph.
         """
         if src is dst:
             return True
-        for e in src.edges:
-            assert e.isDirected()
-            if e.src == src:
-                if self.hasPath(e.dst, dst):
-                    return True
+        for e in src.out_edges.values():
+            if self.hasPath(e.dst, dst):
+                return True
         return False
 
-    def eval_constraints(self):
-        """ Evaluate all constraint nodes.
-        """
-        for n in [node for node in self.node_set if node.getType() == NodeType.CONSTRAINT]:
-            n.proped = {}
-            for e in n.edges:
-                assert e.isDirected()
-                assert e.dst is n
-                assert e.src.out_name in n.ordered_given
-                if not e.src.out_val is None:
-                    n.proped[e.src.out_name] = e.src.out_val
-            if set(n.proped.keys()) == set(n.ordered_given):
-                logging.debug('Eval Con with {}\nResult: {}'.format(
-                    n.proped, n.func(**n.proped)))
-                pass
-
-            if set(n.proped.keys()) < set(n.ordered_given) or not n.func(**(n.proped)):
-                logging.log(logging.ERROR, 'VIOLATION: [{}] on:\n\t{}'.format(n.val.str, n.proped))
-                return False
-        return True
-
     def check(self):
         """ Check for node violations in a functional graph.
         """
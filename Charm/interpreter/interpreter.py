@@ -1,21 +1,30 @@
 import functools
+import hashlib
 import io
 import itertools
+import multiprocessing
 import pickle
-from collections import defaultdict
+import re
+from collections import OrderedDict, defaultdict
 from timeit import default_timer as timer
 
 import mcerp3 as mcerp
 import numpy as np
 from mpl_toolkits.mplot3d import Axes3D
-from sympy import simplify
+from sympy import And, Indexed, IndexedBase, Symbol, simplify, sympify
+from sympy.logic.boolalg import BooleanAtom
 from sympy.parsing.sympy_parser import _token_splittable
 from sympy.utilities.lambdify import lambdify, lambdastr
 
 from Charm.base.helpers import *
-from Charm.models import Dummy
+from Charm.base.uncertain_math import BUILTINS, UncertainNumPyPrinter
+from .algebraic_loop import AlgebraicLoop
+from .decomposition import Decomposition
+from .equation_cache import EquationCache
+from .execution_plan import CheckedRun, ExecutionPlan, unwrap
+from .session import Session
 from .graph import *
-from .smt_wrapper import SMTInstance
+from .smt_wrapper import SMTInstance, toPython
 
 
 def hasExtName(name):
@@ -40,13 +49,105 @@ def getBaseName(name):
     return name
 
 
+# Sweep handed to forked workers: (interpreter, method name, leading arguments).
+_sweep_job = None
+
+
+# Reductions usable with a list condition: numpy reduction, identity.
+kLIST_REDUCTIONS = {
+    Names.summation: (np.sum, 0.),
+    Names.max_func: (np.max, -np.inf),
+    Names.min_func: (np.min, np.inf),
+}
+# Symbol standing for the reduced value in the enclosing relation.
+kLIST_REDUCED = 'list_reduction_'
+
+
+def _listReduction(reduction, elem_func, cond_func, outer_func, *args):
+    """ Evaluates a relation over the reduction of elements whose condition holds.
+
+    Element and condition are evaluated on whole arrays and the reduction runs
+    over the last axis, leading axes batch independent points and are kept
+    with a last axis of length 1, as scalars are batched. Max and Min of no
+    element are nan.
+    """
+    vals, mask = np.broadcast_arrays(np.atleast_1d(np.asarray(elem_func(*args), dtype=float)),
+                                     np.atleast_1d(np.asarray(cond_func(*args), dtype=bool)))
+    func, identity = kLIST_REDUCTIONS[reduction]
+    batched = vals.ndim > 1
+    reduced = func(np.where(mask, vals, identity), axis=-1, keepdims=batched)
+    if reduction != Names.summation:
+        reduced = np.where(mask.any(axis=-1, keepdims=batched), reduced, np.nan)
+    if reduced.ndim == 0:
+        reduced = reduced.item()
+    return outer_func(*(args + (reduced,)))
+
+
+def _constant(val):
+    return val
+
+
+def _sweepWorker():
+    interp = _sweep_job[0]
+    # z3 state is not shared with the parent, every worker translates its own
+    # on first use and keeps it for all the blocks it takes.
+    interp.remainder_smt = None
+    interp.model_smt = None
+
+
+def _sweepShard(bounds):
+    interp, method, args = _sweep_job
+    return getattr(interp, method)(*(args + tuple(bounds)))
+
+
+def _snakeProduct(iter_vals, start, stop):
+    """ Points [start, stop) of the Cartesian product of iter_vals in reflected
+    order: every inner position runs backwards when its outer counter is odd, so
+    consecutive points differ in exactly one position.
+    """
+    radices = [len(v) for v in iter_vals][::-1]
+    for i in range(start, stop):
+        point = []
+        q = i
+        for r in radices:
+            d = q % r
+            q //= r
+            point.append(r - 1 - d if q % 2 else d)
+        yield tuple([vals[d] for vals, d in zip(iter_vals, point[::-1])])
+
+
 class Interpreter(object):
-    def __init__(self, program, use_z3=False, drawable=False, mcsamples=100, process_callback=lambda x: None):
+    # State compile() produces, restored when the fingerprint of a model matches.
+    kCOMPILED = ('graph', 'v2n', 'var_set', 'ext_names', 'decomposition', 'remainder', 'dead', 'use_smt',
+                 'modules', 'printer', 'plans')
+    # Compiled models kept in the process, least recently used first.
+    kCOMPILED_RUNS = 8
+    _compiled = OrderedDict()
+
+    def __init__(self, program, use_z3=False, drawable=False, mcsamples=100, process_callback=lambda x: None,
+                 vectorize=False, jobs=1, use_cache=True, fuse=False, dump_fused=None,
+                 cse=True, smt_timeout=None, smt_encoding='auto'):
         # This sets the sample number for MC.
         # Callback: f(category,message)
         mcerp.npts = mcsamples
         self.use_z3 = use_z3
         self.drawable = drawable
+        self.vectorize = vectorize  # Evaluate all sweep points at once with arrays.
+        self.jobs = max(1, jobs)  # Worker processes used for sweeps.
+        self.use_cache = use_cache  # Reuse solved relations and compiled models across runs.
+        self.eq_cache = EquationCache() if use_cache else None  # Solved relations kept across runs.
+        self.fuse = fuse or dump_fused is not None  # Evaluate the model as one generated function.
+        self.dump_fused = dump_fused  # Path the fused model source is written to.
+        self.cse = cse  # Compute subterms shared across equations once.
+        self.remainder = set()  # Relations solved by SMT on top of the functional graph.
+        self.use_smt = False  # Whole model solved as one SMT instance.
+        self.remainder_smt = None  # SMT instance of the remainder, see remainderInstance.
+        self.model_smt = None  # SMT instance of the whole model, see modelInstance.
+        self.smt_timeout = smt_timeout  # Seconds an SMT point may take before it is given up.
+        self.smt_encoding = smt_encoding  # Arithmetic of SMT instances, see SMTInstance.
+        self.prune = True  # Leave out equations the targets and constraints do not depend on.
+        self.fold = True  # Substitute single-valued inputs into the relations.
+        self.dead = set()  # Equations left out by pruning.
         self.program = program
         self.nodes = program.nodes
         self.graph = Graph(self.drawable)
@@ -54,6 +155,9 @@ class Interpreter(object):
         self.eq_set = set()  # Equations assumed.
         self.con_set = set()  # Constraints assumed.
         self.targets = []  # Target variables to solve for.
+        self.objectives = []  # (target, minimize) to optimize, in priority order.
+        self.pareto = False  # Objectives optimized jointly rather than by priority.
+        self.optimum = []  # Tags of the optimal sweep points.
         self.v2t = {}  # Variable -> typeNode, assumed.
         self.given = {}  # Variables  -> value given in let stmt.
         self.assumptions = {}  # Variables -> value given in rule def.
@@ -61,13 +165,50 @@ class Interpreter(object):
         self.n2r = {}  # Rule name to RuleNode.
         self.v2v = {}  # Variable name to VarNode.
         self.n2t = {}  # Type name to TypeNode.
+        self.type_preds = {}  # Type name to compiled constraint predicate.
         self.v2l = {}  # Variable name to LetNode.
         self.plot_nodes = []  # Plot tasks
         self.stack = deque()
         self.process_callback = process_callback
 
+    def type_predicate(self, var):
+        """ Predicate on arrays of values for the constraints of the type of var.
+
+        All constraints of a type are compiled once into a single NumPy function
+        returning an element-wise boolean mask.
+        """
+        typeNode = self.v2t[var]
+        if typeNode.name not in self.type_preds:
+            use = Symbol(typeNode.short_name)
+            expr = And(*[parse_expr(con) for con in typeNode.constraints])
+            self.type_preds[typeNode.name] = lambdify(use, expr, modules='numpy')
+        return self.type_preds[typeNode.name]
+
+    def type_mask(self, var, vals):
+        """ Boolean mask of the elements of the array vals satisfying the type of var.
+        """
+        vals = np.asarray(vals)
+        return np.broadcast_to(self.type_predicate(getBaseName(var))(vals), vals.shape)
+
+    def type_filter(self, var, val):
+        """ Returns val if it satisfies the type of var, None otherwise.
+
+        Uncertain values are restricted to their valid samples, in a new
+        value, and are rejected only when no sample is valid.
+        """
+        if val is None:
+            return None
+        if isinstance(val, mcerp.UncertainFunction):
+            mask = self.type_mask(var, val._mcpts)
+            if not mask.any():
+                return None
+            return val if mask.all() else mcerp.UncertainFunction(val._mcpts[mask])
+        return val if self.type_mask(var, val).all() else None
+
     def type_check(self, var, ival):
         """ Checks constraints associated with type.
+
+        Samples of uncertain values violating the constraints are dropped in place.
         """
         if ival is None:
             return False
@@ -77,36 +218,15 @@ class Interpreter(object):
         assert isinstance(var, tuple) and isinstance(ival, tuple), \
             'Inconsistent iterable type {}: {}'.format(var, ival)
         for var, v in zip(var, ival):
-            var = getBaseName(var)
             if not isinstance(v, list):
                 v = [v]
             for val in v:
-                """
-                # Data type checking.
-                    typeNode = self.v2t[var]
-                    type_val = type(val)
-                    if type_val.__module__ == np.__name__:
-                        type_val = type(np.asscalar(val))
-                    assert type_val is eval(typeNode.data_type), \
-                            'Type of {} is {}, but defined as {}'.format(
-                                    var, type_val, typeNode.name)
-                """
-                typeNode = self.v2t[var]
-                for con in typeNode.constraints:
-                    expr = parse_expr(con)
-                    if isinstance(val, mcerp.UncertainFunction):
-                        value = val._mcpts
-                        valid_p = []
-                        for check_v in value:
-                            if expr.subs(typeNode.use, check_v):
-                                valid_p.append(check_v)
-                        if valid_p:
-                            val._mcpts = np.asarray(valid_p)
-                            return True
-                        else:
-                            return False
-                    else:
-                        return expr.subs(typeNode.use, val)
+                checked = self.type_filter(var, val)
+                if checked is None:
+                    return False
+                if checked is not val:
+                    val._mcpts = checked._mcpts
+        return True
 
     def convert_to_functional_graph(self):
         graph = nx.Graph()
@@ -133,6 +253,8 @@ class Interpreter(object):
         vars = {n for n, d in graph.nodes(data=True) if d['bipartite'] == 0}
         equations = set(graph) - vars
         match = nx.bipartite.maximum_matching(graph, vars)
+        self.decomposition = Decomposition(graph, vars, match, id_node_map)
+        self.decomposition.dump()
         for equation in equations:
             if equation not in match:
                 id_node_map[equation].type = NodeType.CONSTRAINT
@@ -143,10 +265,97 @@ class Interpreter(object):
                     edge.set(eq, var)
                 else:
                     edge.set(var, eq)
-        for var in vars:
-            if var not in match:
-                return False
-        return True
+        return self.decomposition.isDetermined()
+
+    def splitRemainder(self):
+        """ Relations the functional graph cannot evaluate, left to the SMT solver:
+        the under-determined equations and the constraints on their variables.
+        """
+        under = self.decomposition.under_vars
+        self.remainder = set(self.decomposition.under_eqs)
+        for n in self.graph.getNextConNode():
+            if any([n.next(e) in under for e in n.edges]):
+                self.remainder.add(n)
+        return self.remainder
+
+    def eliminateDead(self):
+        """ Equations neither the targets nor the constraints depend on, left out
+        of code generation and evaluation.
+        """
+        roots = [n for n in self.graph.node_set if n.getType() == NodeType.CONSTRAINT or
+                 ((n.getType() == NodeType.VARIABLE or n.getType() == NodeType.INPUT) and n.val in self.targets)]
+        live = set(roots)
+        stack = list(roots)
+        while stack:
+            cur = stack.pop()
+            for e in cur.edges:
+                # Upstream along directed edges, both ways in the under-determined part.
+                if e.isDirected() and e.dst is not cur:
+                    continue
+                nb = cur.next(e)
+                if nb not in live:
+                    live.add(nb)
+                    stack.append(nb)
+        self.dead = set([n for n in self.graph.getNextEqNode() if n not in live])
+        if self.dead:
+            logging.info('Skipping {} equations the targets do not depend on'.format(len(self.dead)))
+        return self.dead
+
+    def foldedInputs(self):
+        """ Inputs with a single scalar value, substituted into the relations.
+        """
+        consts = {}
+        for key, vals in self.given.items():
+            if len(vals) != 1:
+                continue
+            for var, v in zip(key, vals[0]):
+                if isinstance(v, (int, float)) and not isinstance(v, bool) and \
+                        not self.v2v[getBaseName(var)].vector:
+                    consts[var] = v
+        return consts
+
+    def foldConstants(self, modules, printer=None):
+        """ Substitutes the folded inputs into the solved relations, in topological
+        order. Equations left with constant inputs only become constants
+        themselves, computed once here, and are substituted further.
+
+        The graph is left as compiled, returns node -> (func, solution, given)
+        of the folded relations.
+        """
+        consts = self.foldedInputs()
+        folds = {}
+        nodes = [block[0] for block in self.graph.getTopologicalBlocks() if len(block) == 1]
+        for n in nodes + list(self.graph.getNextConNode()):
+            fold = self.foldNode(n, consts, modules, printer)
+            if fold is not None:
+                folds[n] = fold
+        logging.debug('Folded constants into {} relations'.format(len(folds)))
+        return folds
+
+    def foldNode(self, n, consts, modules, printer):
+        if n in self.remainder or n in self.dead or n.val.scripted or n.solution is None or \
+                n.solution.atoms(Indexed, IndexedBase):
+            return None
+        if n.getType() == NodeType.EQUATION and self.v2v[getBaseName(n.out_name)].vector:
+            return None
+        subs = dict([(Symbol(name), sympify(consts[name])) for name in n.ordered_given if name in consts])
+        if not subs:
+            return None
+        solution = n.solution.xreplace(subs)
+        given = [name for name in n.ordered_given if name not in consts]
+        if not given:
+            if not solution.is_Number and not isinstance(solution, BooleanAtom):
+                # Not plain arithmetic, e.g. sampling a distribution, left as is.
+                return None
+            # Evaluated by the generated function, as it would be at every point.
+            try:
+                val = unwrap(n.func(*[consts[name] for name in n.ordered_given]))
+            except (ArithmeticError, TypeError, ValueError):
+                return None
+            if n.getType() == NodeType.EQUATION and isinstance(val, (int, float)) and not isinstance(val, bool):
+                consts[n.out_name] = val
+            return functools.partial(_constant, val), solution, given
+        return lambdify(tuple(given), solution, modules=modules, printer=printer), solution, given
 
     def generate_functions(self):
         def can_split(symbol):
@@ -167,87 +376,104 @@ class Interpreter(object):
                         indexing = indexing - 1
                 return func_str
 
-            def actual_func(cond_func, func, **kwargs):
-                cond_filter = cond_func(**kwargs)
-                filtered_args = {}
-                for k, v in kwargs.items():
-                    filtered_args[k] = [val for val, cond in zip(v, cond_filter) if cond]
-                return func(**filtered_args)
-
             assert node.val.scripted
-            start = node.val.toks.index(Names.listCond)
-            end = node.val.toks.index(')', start)
-            cond_toks = node.val.toks[start + 1:end]
-            cond_str = strip_index(cond_toks)
-            func_toks = node.val.toks[:start] + node.val.toks[end:]
-            func_str = strip_index(func_toks)
+            toks = node.val.toks
+            bar = toks.index(Names.listCond)
+            # The reduction enclosing the list condition: reduction ( element | condition ).
+            depth = 0
+            for lpar in range(bar - 1, -1, -1):
+                if toks[lpar] == ')':
+                    depth += 1
+                elif toks[lpar] == '(':
+                    if not depth:
+                        break
+                    depth -= 1
+            depth = 0
+            for rpar in range(bar + 1, len(toks)):
+                if toks[rpar] == '(':
+                    depth += 1
+                elif toks[rpar] == ')':
+                    if not depth:
+                        break
+                    depth -= 1
+            reduction = toks[lpar - 1] if lpar > 0 else None
+            assert reduction in kLIST_REDUCTIONS, \
+                'Unsupported list reduction {} in {}'.format(reduction, node.val.orig)
+            elem_str = strip_index(toks[lpar + 1:bar])
+            cond_str = strip_index(toks[bar + 1:rpar])
+            outer_str = strip_index(toks[:lpar - 1] + [kLIST_REDUCED] + toks[rpar + 1:])
 
-            syms = {}
+            syms = SympyHelper.initSyms(kLIST_REDUCED)
             for name in node.val.names:
                 syms.update(SympyHelper.initSyms(name))
-            cond_exprs = SympyHelper.initExprs([cond_str], syms)
-            func_exprs = SympyHelper.initExprs([func_str], syms)
-            cond_sol = simplify(cond_exprs)[0]
-            func_sol = list(solve(func_exprs, exclude=list(SympyHelper.initSyms(node.ordered_given).values()),
-                                  check=False, manual=True, rational=False)[0].values())[0]
-
-            cond_func = lambdify(tuple(node.ordered_given), cond_sol,
-                                 modules=[{'umin': umin, 'ufloor': ufloor}, mcerp.umath, 'numpy', 'sympy'])
-            func = lambdify(tuple(node.ordered_given), func_sol,
-                            modules=[{'umin': umin, 'ufloor': ufloor}, mcerp.umath, 'numpy', 'sympy'])
-            node.func = functools.partial(actual_func, cond_func=cond_func, func=func)
-            node.func_str = lambdastr(tuple(node.ordered_given), func_sol)
-
-        def umin(a, b):
-            if not isinstance(a, mcerp.UncertainFunction) and not isinstance(b, mcerp.UncertainFunction):
-                return min(a, b)
-            else:
-                x = Dummy()
-                if not isinstance(a, mcerp.UncertainFunction):
-                    tmp_a = np.asarray([a] * len(x._mcpts))
-                    tmp_b = b._mcpts
-                elif not isinstance(b, mcerp.UncertainFunction):
-                    tmp_a = a._mcpts
-                    tmp_b = np.asarray([b] * len(x._mcpts))
-                else:
-                    raise ValueError('Should not be here, flip the table and run!')
-                for i in range(len(x._mcpts)):
-                    x._mcpts[i] = min(tmp_a[i], tmp_b[i])
-                return x
-
-        def ufloor(a):
-            if not isinstance(a, mcerp.UncertainFunction):
-                return np.floor(a)
+            given = list(node.ordered_given)
+            elem_expr = SympyHelper.initExprs([elem_str], syms)[0]
+            cond_expr = SympyHelper.initExprs([cond_str], syms)[0]
+            outer_exprs = SympyHelper.initExprs([outer_str], syms)
+            if node.getType() == NodeType.CONSTRAINT:
+                outer_sol = cached((outer_str, None, tuple(given), 'simplify', ()),
+                                   lambda: simplify(outer_exprs)[0])
             else:
-                x = np.asarray([np.floor(i) for i in a._mcpts])
-                a._mcpts = x
-                return a
+                outer_sol = cached((outer_str, node.out_name, tuple(given), 'solve', ()),
+                                   lambda: list(solve(outer_exprs,
+                                                      exclude=list(SympyHelper.initSyms(
+                                                          given + [kLIST_REDUCED]).values()),
+                                                      check=False, manual=True, rational=False)[0].values())[0])
+
+            elem_func = lambdify(tuple(given), elem_expr, modules=modules, printer=printer)
+            cond_func = lambdify(tuple(given), cond_expr, modules=modules, printer=printer)
+            outer_func = lambdify(tuple(given + [kLIST_REDUCED]), outer_sol, modules=modules, printer=printer)
+            node.func = functools.partial(_listReduction, reduction, elem_func, cond_func, outer_func)
+            node.func_str = lambdastr(tuple(given + [kLIST_REDUCED]), outer_sol)
+
+        modules = [BUILTINS, mcerp.umath, 'numpy', 'sympy']
+        printer = UncertainNumPyPrinter.forModules(modules)
+        # Kept for whole-model code generation.
+        self.modules = modules
+        self.printer = printer
+
+        def cached(parts, compute):
+            if self.eq_cache is None:
+                return compute()
+            return self.eq_cache.cached(parts, compute)
 
         def do_generation(cur, do_solve=False):
             assert isinstance(cur.val, Relation)
             syms = {}
+            indexed = []
             # print cur.dump()
             for name in cur.val.names:
-                syms.update(SympyHelper.initSyms(name,
-                                                 self.v2v[getBaseName(name)].vector and cur.val.deferred))
-            exprs = SympyHelper.initExprs([cur.val.str], syms)
-            # Sympy bug workaround:
-            # Must set rational to False, otherwise piecewise function cannot be solved correctly.
-            if do_solve:
-                solutions = solve(exprs, exclude=list(SympyHelper.initSyms(cur.ordered_given).values()),
-                                  check=False, manual=True, rational=False)
-                solution = list(solutions[0].values())[0]
-            else:
-                solutions = simplify(exprs)
-                solution = solutions[0]
-            if len(solutions) != 1:
-                # We cannot handle multiplte solutions yet.
-                raise NotImplementedError
-            cur.func = lambdify(tuple(cur.ordered_given), solution,
-                                modules=[{'umin': umin, 'ufloor': ufloor}, mcerp.umath, 'numpy', 'sympy'])
+                deferred = self.v2v[getBaseName(name)].vector and cur.val.deferred
+                syms.update(SympyHelper.initSyms(name, deferred))
+                if deferred:
+                    indexed.append(name)
+
+            def compute():
+                exprs = SympyHelper.initExprs([cur.val.str], syms)
+                # Sympy bug workaround:
+                # Must set rational to False, otherwise piecewise function cannot be solved correctly.
+                if do_solve:
+                    solutions = solve(exprs, exclude=list(SympyHelper.initSyms(cur.ordered_given).values()),
+                                      check=False, manual=True, rational=False)
+                    solution = list(solutions[0].values())[0]
+                else:
+                    solutions = simplify(exprs)
+                    solution = solutions[0]
+                if len(solutions) != 1:
+                    # We cannot handle multiplte solutions yet.
+                    raise NotImplementedError
+                return solution
+
+            solution = cached((cur.val.str, cur.out_name, tuple(cur.ordered_given),
+                               'solve' if do_solve else 'simplify', tuple(sorted(indexed))), compute)
+            cur.solution = solution
+            cur.func = lambdify(tuple(cur.ordered_given), solution, modules=modules, printer=printer)
             cur.func_str = lambdastr(tuple(cur.ordered_given), solution)
 
-        # TODO: cycle elimination.
+        # Equations on a cycle are solved simultaneously, not one by one.
+        skip = self.remainder | self.dead
+        loops = [b for b in self.graph.getTopologicalBlocks() if len(b) > 1 and not set(b) & skip]
+        in_loop = set([n for b in loops for n in b])
 
         # Turns equation into lambda function.
         for cur in self.graph.getNextEqNode():
@@ -261,14 +487,28 @@ class Interpreter(object):
                     assert e.src is cur
                     assert e.dst.getType() == NodeType.VARIABLE
                     cur.setOutName(e.dst.val)
+            if cur in in_loop or cur in skip:
+                continue
             if cur.val.scripted:
                 do_filter(cur)
             else:
                 # This is generating value, do solving.
                 do_generation(cur, do_solve=True)
 
+        for block in loops:
+            if any([n.val.scripted or (n.val.deferred and any([self.v2v[getBaseName(v)].vector
+                                                               for v in n.val.names])) for n in block]):
+                logging.error('Cannot solve algebraic loop with vectors or list conditions:\n\t{}'.format(
+                    '\n\t'.join([n.val.str for n in block])))
+                continue
+            loop = AlgebraicLoop(block, modules, printer)
+            for n in block:
+                n.loop = loop
+
         # Turns constraint into lambda function.
         for cur in self.graph.getNextConNode():
+            if cur in self.remainder:
+                continue
             cur.ordered_given = []
             for e in cur.edges:
                 assert e.isDirected()
@@ -282,36 +522,9 @@ class Interpreter(object):
             else:
                 do_generation(cur)
 
-    def evaluate_graph(self, node, k, val):
-        """ Evaluates node and propogates its value.
-        """
-        if val is None:
-            return
-        if (isinstance(val, tuple) or isinstance(val, list)) and len(val) == 1:
-            val = val[0]
-        if node.getType() == NodeType.INPUT or node.getType() == NodeType.VARIABLE:
-            assert k == node.val, 'Unknown variable {} encountered durig evaluation'.format(k)
-            node.out_val = val
-            for e in node.edges:
-                assert e.isDirected()
-                if e.src is node:
-                    self.evaluate_graph(e.dst, node.out_name, node.out_val)
-        elif node.getType() == NodeType.EQUATION:
-            assert k in node.ordered_given, \
-                'Unknown keyword {} propagated to node {}'.format(k, node.getPrintable())
-            node.proped[k] = val
-            # When we have all inputs ready.
-            if set(node.ordered_given) == set(node.proped.keys()):
-                logging.debug('evaluate: {}'.format(node.func_str))
-                logging.debug('with: {}'.format(node.proped))
-                for k, v in node.proped.items():
-                    logging.debug('\t{}: {}'.format(k, type(v)))
-                node.out_val = node.func(**node.proped)
-                logging.debug('gen: {}={}'.format(node.out_name, node.out_val))
-                self.evaluate_graph(self.v2n[node.out_name], node.out_name, node.out_val)
-        else:
-            assert node.getType() == NodeType.CONSTRAINT, \
-                'Unknown node type {} when evaluatig node {}'.format(*node.getPrintable())
+        if self.eq_cache is not None:
+            logging.debug('Equation cache: {} hits, {} misses'.format(self.eq_cache.hits, self.eq_cache.misses))
+            self.eq_cache.evict()
 
     def build_dependency_graph(self):
         self.process_callback('building dependency graph')
@@ -329,12 +542,9 @@ class Interpreter(object):
         for inputs in list(self.given.keys()):
             # After gen_input, each input is in the form of a tuple.
             for v in inputs:
-                exist = False
-                for n in self.graph.node_set:
-                    if n.getType() == NodeType.VARIABLE and n.val == v:
-                        exist = True
-                        n.setType(NodeType.INPUT)
-                if not exist:
+                if v in self.v2n:
+                    self.v2n[v].setType(NodeType.INPUT)
+                else:
                     self.v2n[v] = GraphNode(NodeType.INPUT, v)
                     if hasExtName(v):
                         self.v2n[v].addExtName(getExtName(v))
@@ -381,7 +591,7 @@ class Interpreter(object):
 
     def splitNode(self, cur, ext_set):
         logging.debug('Split [{}] {}'.format(cur.id, cur.getPrintable()))
-        if not cur in self.graph.node_set:
+        if not self.graph.hasNode(cur):
             return
         neighbours = [cur.next(e) for e in cur.edges
                       if not (set(cur.next(e).exts) & ext_set) and not cur.next(e).marked]
@@ -395,6 +605,7 @@ class Interpreter(object):
             del self.v2n[cur.val]
             for n in cloned_set:
                 self.var_set.add(n.val)
+                self.ext_names.setdefault(cur.val, set()).add(n.exts[-1])
                 self.v2n[n.val] = n
                 self.v2n[n.val].setOutName(n.val)
             for n in neighbours:
@@ -421,8 +632,13 @@ class Interpreter(object):
         2. Merge variables with same names.
         3. Checks exts along the path and delete dummy edges.
         """
+        # Extensions of every base name, kept up to date while splitting.
+        self.ext_names = {}
+        for v in self.var_set:
+            if hasExtName(v):
+                self.ext_names.setdefault(getBaseName(v), set()).add(getExtName(v))
         # All base names with extended versions.
-        basis = set([getBaseName(v) for v in self.var_set if hasExtName(v)])
+        basis = set(self.ext_names.keys())
         logging.debug('base names: {}'.format(basis))
         for base_name in basis:
             if base_name in self.var_set:
@@ -438,42 +654,39 @@ class Interpreter(object):
             # Otherwise, the extensios only exist in inputs, or the node has been split
             # via propagation.
         # Merge identical variable nodes.
-        remove_set = set()
-        for name in list(self.v2n.keys()):
-            cur = self.v2n[name]
-            for n in self.graph.node_set:
-                if not n is cur and n.val == cur.val:
-                    logging.debug('Merging {}'.format(n.val))
-                    # The following is not true in pra model when the extensions
-                    # appear in the same connected component as the base. They
-                    # can be linked via some path (other variables in between).
-                    # assert not self.graph.isConnected(n, cur)
-                    for e in n.edges:
-                        nn = n.next(e)
-                        if e.isDirected():
-                            if e.src is n:
-                                new_edge = GraphEdge(cur, nn, cur, nn)
-                            else:
-                                assert e.dst is n
-                                new_edge = GraphEdge(cur, nn, nn, cur)
+        by_name = {}
+        for n in self.graph.node_set:
+            if n.getType() == NodeType.VARIABLE or n.getType() == NodeType.INPUT:
+                by_name.setdefault(n.val, []).append(n)
+        for name, cur in list(self.v2n.items()):
+            for n in by_name.get(name, []):
+                if n is cur:
+                    continue
+                logging.debug('Merging {}'.format(n.val))
+                # The following is not true in pra model when the extensions
+                # appear in the same connected component as the base. They
+                # can be linked via some path (other variables in between).
+                # assert not self.graph.isConnected(n, cur)
+                for e in n.edges:
+                    nn = n.next(e)
+                    if e.isDirected():
+                        if e.src is n:
+                            new_edge = GraphEdge(cur, nn, cur, nn)
                         else:
-                            new_edge = GraphEdge(cur, nn)
-                        cur.addEdge(new_edge)
-                        nn.addEdge(new_edge)
-                        self.graph.addEdge(new_edge)
-                    if n.getType() == NodeType.INPUT:
-                        cur.setType(NodeType.INPUT)
-                    remove_set.add(n)
-        # Remove dup nodes.
-        for n in remove_set:
-            self.graph.removeNode(n)
+                            assert e.dst is n
+                            new_edge = GraphEdge(cur, nn, nn, cur)
+                    else:
+                        new_edge = GraphEdge(cur, nn)
+                    cur.addEdge(new_edge)
+                    nn.addEdge(new_edge)
+                    self.graph.addEdge(new_edge)
+                if n.getType() == NodeType.INPUT:
+                    cur.setType(NodeType.INPUT)
+                self.graph.removeNode(n)
 
     def findAllExtNames(self, base_name):
         assert not hasExtName(base_name)
-        exts = set()
-        for var in self.var_set:
-            if hasExtName(var) and base_name == getBaseName(var):
-                exts.add(getExtName(var))
+        exts = set(self.ext_names.get(base_name, ()))
         assert exts
         logging.debug('All ext names for {}: {}'.format(base_name, exts))
         return exts
@@ -559,6 +772,8 @@ class Interpreter(object):
                     assert t in self.var_set, \
                         'Unknown variable to explore: {}'.format(t)
                     self.targets.append(t)
+                self.objectives.extend(s.objectives)
+                self.pareto = self.pareto or s.pareto
                 assert self.targets, 'Empty solve target set.'
                 # Check solvable.
                 unique_variables = set([getBaseName(k) for k in self.var_set])
@@ -604,7 +819,8 @@ class Interpreter(object):
                         self.v2t[k].name, val)
                 if not isinstance(k, tuple):
                     k = (k,)
-                    val = (val,)
+                    # A single sweep point, tuples keep result tags hashable.
+                    val = [(tuple(val),)]
             elif isinstance(val, list):
                 tval = []
                 for one_val in val:
@@ -623,93 +839,271 @@ class Interpreter(object):
                 if not isinstance(k, tuple):
                     k = (k,)
                     val = [(val,)]
+                else:
+                    # A single point of a tuple of variables.
+                    val = [val]
             tup_given[k] = val
         self.given = tup_given
         # Add assumptions to given dict.
         for k, v in self.assumptions.items():
-            self.given[(k,)] = [(eval(v),)]
-
-    def optimizeSMT(self, smt, knobs, k2s=None, minimize=True):
-        """ Turns SMT solving to optimization by iteratively adding
-            assumptions about 'knobs' with a step defined in dict k2s.
+            val = eval(v)
+            self.given[(k,)] = [(tuple(val) if isinstance(val, list) else val,)]
 
-        Args:
-            smt: an SMTInstance.
-            knobs: list of variable names that we can tune.
-            k2s: var_name -> step_value.
-            minimize: direction of optimization.
+    def modelInstance(self):
+        """ SMT instance of all relations and variable types, built on first use.
+        Sweep values are assumed per point.
         """
+        if self.model_smt is None:
+            var_map = {}
+            rel_list = []
+            # Variable types.
+            for var in list(self.v2t.keys()):
+                var_map[var] = self.v2t[var].data_type
+            # Relations.
+            names = set()
+            for n in self.graph.getNextRelationNode():
+                rel_list.append(n.val.str)
+                names.update(n.val.names)
+            # Values must satisfy their types.
+            rel_list.extend(self.typeConstraints([name for name in names if getBaseName(name) in self.v2t]))
+            self.model_smt = SMTInstance(var_map, rel_list, self.smt_timeout, self.smt_encoding)
+        return self.model_smt
 
-        assert smt, 'No smt instance to optimize.'
-        assert knobs, 'Optimizing objective is emptyset.'
-        smt.dump()
-        solution = smt.solve()
-        opt_solution = solution
-        while solution:
-            logging.debug('SMT OPT TRACE: {}'.format(solution))
-            opt_solution = solution
-            asmpts = []
-            for k in knobs:
-                op = '<' if minimize else '>'
-                new_con = k + op + '(' + str(solution[k]) + '+' + str(k2s[k]) + ')'
-                asmpts.append(new_con)
-            logging.debug('SMT assumes\n\t[{}]'.format(',\n\t'.join(asmpts)))
-            smt.makeAssumptions(asmpts)
-            smt.dump()
-            solution = smt.solve()
-            smt.clearAssumptions()
-        logging.log(logging.DEBUG, '{}: {}'.format('Opt solution', '[' + ',\n'.join(
-            [tar + ': ' + str(opt_solution[tar]) for tar in self.targets]) + ']'))
+    def smtPoints(self, iter_vars, iter_vals, start, stop):
+        """ Solves points [start, stop) of the sweep's Cartesian product.
 
-    def constructSMTInstance(self):
-        var_map = {}
-        rel_list = []
-        # Variable types.
-        for var in list(self.v2t.keys()):
-            var_map[var] = self.v2t[var].data_type
-        # Relations.
-        for n in self.graph.getNextRelationNode():
-            rel_list.append(n.val.str)
-        # Relations from let stmt.
-        let_eqs = []
-        mutable_eqs = []
+        Returns (tag, target values) of the satisfiable points in sweep order.
+        """
+        # The relations are translated once, every point is solved under its own assumptions.
+        smt = self.modelInstance()
+        rows = []
+        for t in itertools.islice(itertools.product(*tuple(iter_vals)), start, stop):
+            mutable_eqs = []
+            for key, val in zip(iter_vars, t):
+                for k, v in zip(key, val):
+                    mutable_eqs.append(k + '=' + str(v))
+            smt.makeAssumptions(mutable_eqs)
+            try:
+                if self.objectives:
+                    solutions = smt.optimize(self.objectives, self.pareto)
+                else:
+                    solution = smt.solve()
+                    solutions = [solution] if solution is not None else []
+            finally:
+                smt.clearAssumptions()
+            tag = tuple(itertools.chain(*t))
+            for k, solution in enumerate(solutions):
+                row = []
+                for tar in self.targets:
+                    out_val = self.type_filter(tar, toPython(solution[tar])) if tar in solution else None
+                    row.append(out_val if out_val is not None else float("nan"))
+                # Points of a Pareto front are told apart by their index.
+                rows.append((tag + (k,) if self.pareto else tag, row))
+        return rows
+
+    def solveSMT(self):
+        self.process_callback('solving')
         results = defaultdict(list)
         iter_vars, iter_vals = [], []
         flat_iter_vars = []
+        # Every given value is a list of sweep points, see gen_inputs.
         for k, v in self.given.items():
-            if isinstance(v, list):
-                iter_vars.append(k)
-                iter_vals.append(v)
-                for var in k:
-                    flat_iter_vars.append(var)
+            iter_vars.append(k)
+            iter_vals.append(v)
+            for var in k:
+                flat_iter_vars.append(var)
         if flat_iter_vars:
             logging.log(logging.DEBUG, "Result {}".format(tuple(flat_iter_vars)))
+        total = 1
+        for val in iter_vals:
+            total *= len(val)
+        if self.pareto:
+            flat_iter_vars.append(Names.pareto)
+        for rows in self.sweepShards('smtPoints', (iter_vars, iter_vals), total):
+            for tag, row in rows:
+                if tag in results:
+                    continue
+                results[tag] = row
+                for tar, out_val in zip(self.targets, row):
+                    logging.info('Result {} -> {} = {}'.format(tag, tar, out_val))
 
-        # Handle flat variables.
-        for key, val in self.given.items():
-            for k, v in zip(key, val):
-                # Propagate non-iterables first.
-                if not k in flat_iter_vars and k in self.v2n:
-                    let_eqs.append(k + '=' + str(v))
+        self.result = results
+        self.variables = iter_vars
+        self.values = iter_vals
+        self.flat_variables = flat_iter_vars
 
-        rel_list.extend(let_eqs)
-        return SMTInstance(var_map, rel_list)
+    def selectOptimum(self):
+        """ Tags of the results optimal for the objectives: the best by priority,
+        or the Pareto front. Points with a nan objective are left out.
+        """
+        cols = [(self.targets.index(t), minimize) for t, minimize in self.objectives]
+        points = []
+        for tag, row in self.result.items():
+            key = tuple([row[i] if minimize else -row[i] for i, minimize in cols])
+            if all([v == v for v in key]):
+                points.append((key, tag))
+        points.sort(key=lambda p: p[0])
+        if not points:
+            return []
+        if not self.pareto:
+            return [tag for key, tag in points if key == points[0][0]]
+        # Sorted, a point can only be dominated by one before it.
+        front = []
+        for key, tag in points:
+            if not any([all([a <= b for a, b in zip(f, key)]) for f, _ in front]):
+                front.append((key, tag))
+        return [tag for _, tag in front]
 
-    def solveSMT(self):
-        var_map = {}
+    def typeConstraints(self, names):
+        """ Constraints of the types of the variables in names, on the variables.
+        """
         rel_list = []
-        # Variable types.
-        for var in list(self.v2t.keys()):
-            var_map[var] = self.v2t[var].data_type
-        # Relations.
-        for n in self.graph.getNextRelationNode():
-            rel_list.append(n.val.str)
-        # Relations from let stmt.
-        let_eqs = []
-        mutable_eqs = []
+        for name in sorted(names):
+            t = self.v2t[name if name in self.v2t else getBaseName(name)]
+            for con in t.constraints:
+                rel_list.append(re.sub(r'\b{}\b'.format(re.escape(t.short_name)), name, con))
+        return rel_list
+
+    def remainderInstance(self):
+        """ SMT instance of the remainder relations and of the types of its
+        unknowns, built on first use. Values of known neighbours are assumed per point.
+        """
+        if self.remainder_smt is None:
+            under = self.decomposition.under_vars
+            names = set([v.val for v in under])
+            # Unknowns must satisfy their types.
+            rel_list = self.typeConstraints(names)
+            for n in self.remainder:
+                names.update(n.val.names)
+                rel_list.append(n.val.str)
+            var_map = dict([(v, self.v2t[v if v in self.v2t else getBaseName(v)].data_type) for v in names])
+            self.remainder_smt = SMTInstance(var_map, rel_list, self.smt_timeout, self.smt_encoding)
+        return self.remainder_smt
+
+    def solveRemainder(self, state):
+        """ Solves the remainder for one point, given the values the plan computed.
+
+        Returns variable name -> value, None if unsatisfiable.
+        """
+        under = self.decomposition.under_vars
+        smt = self.remainderInstance()
+        lets = []
+        for n in self.remainder:
+            for e in n.edges:
+                nb = n.next(e)
+                if nb not in under and state[self.plan.n2s[nb.val]] is not None:
+                    lets.append('{}={}'.format(nb.val, unwrap(state[self.plan.n2s[nb.val]])))
+        # Objectives on the unknowns are optimized, the others are fixed by the point.
+        unknowns = set([v.val for v in under])
+        objectives = [(t, minimize) for t, minimize in self.objectives if t in unknowns]
+        smt.makeAssumptions(lets)
+        try:
+            if objectives:
+                solutions = smt.optimize(objectives)
+                solution = solutions[0] if solutions else None
+            else:
+                solution = smt.solve()
+        finally:
+            smt.clearAssumptions()
+        if solution is None:
+            return None
+        return dict([(k, toPython(v)) for k, v in solution.items()])
+
+    def sweepShards(self, method, args, total):
+        """ Evaluates points [0, total) of a sweep by method(*args, start, stop),
+        on contiguous blocks, handed to worker processes as they free up if jobs > 1.
+
+        Yields the rows of every block, in sweep order.
+        """
+        parallel = self.jobs > 1 and total > 1
+        if parallel and 'fork' not in multiprocessing.get_all_start_methods():
+            # Lambdified functions cannot be pickled, workers must inherit them.
+            logging.warning('Parallel sweep needs fork, evaluating with a single process.')
+            parallel = False
+        n_shards = min(total, self.jobs * 4 if parallel else 20)
+        bounds = [total * s // n_shards for s in range(n_shards + 1)]
+        shards = list(zip(bounds[:-1], bounds[1:]))
+        if not parallel:
+            for shard in shards:
+                yield getattr(self, method)(*(tuple(args) + shard))
+                if total > 20:
+                    self.process_callback('Solving {}% finished'.format(shard[1] * 100 / total))
+            return
+        global _sweep_job
+        _sweep_job = (self, method, tuple(args))
+        try:
+            with multiprocessing.get_context('fork').Pool(self.jobs, initializer=_sweepWorker) as pool:
+                # Blocks come back in order, as soon as they and the ones before are done.
+                for (_, stop), rows in zip(shards, pool.imap(_sweepShard, shards)):
+                    yield rows
+                    if total > 20:
+                        self.process_callback('Solving {}% finished'.format(stop * 100 / total))
+        finally:
+            _sweep_job = None
+
+    def sweepPoints(self, iter_vals, flat_iter_vars, restore, start, stop):
+        """ Evaluates points [start, stop) of the sweep's Cartesian product, in
+        reflected order.
+
+        Returns (tag, target values) of the feasible points in sweep order, tags
+        are reordered by the positions in restore, if any.
+        """
+        plan = self.plan
+        slots = [plan.n2s.get(var) for var in flat_iter_vars]
+        state = plan.newState()
+        checked = CheckedRun(plan, state)
+        last_tag = None
+        already_evaluated = set()
+        rows = []
+        for t in _snakeProduct(iter_vals, start, stop):
+            tag = tuple(itertools.chain(*t))
+            if tag in already_evaluated:
+                continue
+            already_evaluated.add(tag)
+            # Only re-evaluate steps downstream of inputs that differ from the last point.
+            changed = []
+            for j, v in enumerate(tag):
+                if slots[j] is not None and (last_tag is None or
+                                             (v is not last_tag[j] and v != last_tag[j])):
+                    state[slots[j]] = np.asarray(v) if slots[j] in plan.vectors else unwrap(v)
+                    changed.append(slots[j])
+            feasible = checked.run(changed if last_tag is not None else None)
+            last_tag = tag
+            if not feasible:
+                continue
+            vals = state
+            if self.remainder and self.use_z3:
+                solution = self.solveRemainder(state)
+                if solution is None:
+                    logging.log(logging.ERROR, 'Under-determined part unsatisfiable at {}'.format(tag))
+                    continue
+                vals = [solution.get(name) if i not in plan.available else state[i]
+                        for i, name in enumerate(plan.names)]
+            row = []
+            for tar in self.targets:
+                out_val = self.type_filter(tar, vals[plan.n2s[tar]])
+                row.append(out_val if out_val is not None else float("nan"))
+            rows.append((tuple([tag[i] for i in restore]) if restore else tag, row))
+        return rows
+
+    def sweepOrder(self, iter_vars):
+        """ Nesting order of the swept keys, outermost first, by decreasing number
+        of steps downstream of them.
+        """
+        cost = []
+        for key in iter_vars:
+            slots = [self.plan.n2s[var] for var in key if var in self.plan.n2s]
+            cost.append(len(self.plan.schedule(slots)) if slots else 0)
+        order = sorted(range(len(iter_vars)), key=lambda i: -cost[i])
+        logging.debug('Sweep order: {}'.format([(iter_vars[i], cost[i]) for i in order]))
+        return order
+
+    def solveDetermined(self):
+        self.process_callback('solving')
         results = defaultdict(list)
-        iter_vars, iter_vals = [], []
+        iter_vars = []
         flat_iter_vars = []
+        iter_vals = []
         for k, v in self.given.items():
             if isinstance(v, list):
                 iter_vars.append(k)
@@ -717,33 +1111,72 @@ class Interpreter(object):
                 for var in k:
                     flat_iter_vars.append(var)
         if flat_iter_vars:
-            logging.log(logging.DEBUG, "Result {}".format(tuple(flat_iter_vars)))
+            logging.debug("Result {}".format(tuple(flat_iter_vars)))
+        start = timer()
+        # Swept variables with the costliest downstream cones change least often.
+        order = self.sweepOrder(iter_vars)
+        swept_vals = [iter_vals[i] for i in order]
+        swept_vars = [var for i in order for var in iter_vars[i]]
+        restore = [swept_vars.index(var) for var in flat_iter_vars]
+        total = 1
+        for val in iter_vals:
+            total *= len(val)
+        for rows in self.sweepShards('sweepPoints', (swept_vals, swept_vars, restore), total):
+            for tag, row in rows:
+                if tag in results or not row:
+                    continue
+                results[tag] = row
+                for tar, out_val in zip(self.targets, row):
+                    logging.info('Result {} -> {} = {}'.format(tag, tar, out_val))
+        # Reported in the order of the given sweep.
+        swept = results
+        results = defaultdict(list)
+        for t in itertools.product(*tuple(iter_vals)):
+            tag = tuple(itertools.chain(*t))
+            if tag in swept and tag not in results:
+                results[tag] = swept[tag]
 
-        # Handle flat variables.
-        for key, val in self.given.items():
-            for k, v in zip(key, val):
-                # Propagate non-iterables first.
-                if not k in flat_iter_vars and k in self.v2n:
-                    let_eqs.append(k + '=' + str(v))
-        rel_list.extend(let_eqs)
+        end = timer()
+        logging.debug('Sweep of {} points took {:.3f}s'.format(total, end - start))
 
-        # Handle iterations.
-        proped_vals = dict([(k, None) for k in flat_iter_vars])
-        for t in itertools.product(*tuple(iter_vals)):
-            mutable_eqs = []
-            for key, val in zip(iter_vars, t):
-                for k, v in zip(key, val):
-                    mutable_eqs.append(k + '=' + str(v))
-                    proped_vals[k] = v
-            tag = tuple([proped_vals[var] for var in flat_iter_vars])
-            smt = SMTInstance(var_map, rel_list + mutable_eqs)
-            solution = smt.solve()
-            self.result = {}
-            for tar in self.targets:
-                logging.log(logging.DEBUG, 'Result: {} -> {} = {}'.format(tag, tar, solution[tar]))
-                self.result[tar] = solution[tar]
+        self.result = results
+        self.variables = iter_vars
+        self.values = iter_vals
+        self.flat_variables = flat_iter_vars
 
-    def solveDetermined(self):
+    def canVectorize(self, values):
+        """ Sweep values can be batched only for certain values, scalars or
+        vectors of them, and relations indexing vectors only through list conditions.
+        """
+        is_number = lambda v: not isinstance(v, bool) and isinstance(v, (int, float, np.number))
+        for n in self.graph.node_set:
+            if n.getType() == NodeType.EQUATION or n.getType() == NodeType.CONSTRAINT:
+                # Indices would pick sweep points, list conditions reduce the last axis.
+                if not n.val.scripted and n.solution is not None and n.solution.atoms(Indexed, IndexedBase):
+                    return False
+        if any([self.v2v[getBaseName(tar)].vector for tar in self.targets]):
+            return False
+        for t in values:
+            for v in t:
+                if isinstance(v, (tuple, list)):
+                    if not all([is_number(e) for e in v]):
+                        return False
+                elif not is_number(v):
+                    return False
+        return True
+
+    def solveVectorized(self):
+        """ Evaluates all sweep points at once.
+
+        Each swept assumption gets its own array axis: its inputs hold their
+        values along that axis and have length 1 on the others. Equations are
+        evaluated in topological order with numpy broadcasting, so each one runs
+        over the axes of the assumptions it depends on only, i.e. once per value
+        of the outermost loop it would be invariant in. Vectors add a last axis
+        of their elements, and scalars one of length 1, which list conditions
+        reduce over. Constraints become boolean masks over the full sweep. Falls
+        back to solveDetermined when the model cannot be batched.
+        """
         self.process_callback('solving')
         results = defaultdict(list)
         iter_vars = []
@@ -757,48 +1190,59 @@ class Interpreter(object):
                     flat_iter_vars.append(var)
         if flat_iter_vars:
             logging.debug("Result {}".format(tuple(flat_iter_vars)))
-        already_evaluated = set()
-        proped_vals = dict([(k, None) for k in flat_iter_vars])
-        last_proped_vals = None
-        start = timer()
-        total = 1
-        for val in iter_vals:
-            total *= len(val)
-        i = 0
-        for t in itertools.product(*tuple(iter_vals)):
-            i += 1
-            if total > 20 and i % (total // 20) == 0:
-                self.process_callback('Solving {}% finished'.format(i * 100 / total))
-            for key, val in zip(iter_vars, t):
-                for k, v in zip(key, val):
-                    proped_vals[k] = v
-                tag = tuple([proped_vals[var] for var in flat_iter_vars])
-                if tag not in already_evaluated:
-                    already_evaluated.add(tag)
-                    difference = dict([(tmp_k, proped_vals[tmp_k])
-                                       for tmp_k in proped_vals if
-                                       (last_proped_vals[tmp_k] is None or
-                                        proped_vals[tmp_k] != last_proped_vals[tmp_k]) and
-                                       tmp_k in self.v2n]) if last_proped_vals else proped_vals
-                    # Explicitly make a copy.
-                    last_proped_vals = dict(proped_vals)
-                    for k in difference:
-                        # for k in proped_vals: # w/ redundant computation
-                        self.evaluate_graph(self.v2n[k], k, proped_vals[k])
-                    if self.graph.eval_constraints():
-                        tmp_value = []
-                        for tar in self.targets:
-                            if self.type_check(tar, self.v2n[tar].out_val):
-                                # results[tar].append((tag, self.v2n[tar].out_val))
-                                results[tag].append(self.v2n[tar].out_val)
-
-                                logging.info('Result {} -> {} = {}'.format(tag, tar, self.v2n[tar].out_val))
-                            else:
-                                results[tag].append(float("nan"))
-
-                                logging.info('Result {} -> {} = {}'.format(tag, tar, float("nan")))
+        if self.remainder and self.use_z3:
+            logging.info('Model has an under-determined part, evaluating point by point.')
+            self.solveDetermined()
+            return
+        if not self.canVectorize(itertools.chain(*iter_vals)):
+            logging.info('Model cannot be vectorized, evaluating point by point.')
+            self.solveDetermined()
+            return
+        shape = tuple([len(vals) for vals in iter_vals])
+        plan = self.plan
+        state = plan.newState()
+        trail = (1,) if plan.vectors else ()
+        # Scalars over the sweep, a vector valued constraint does not fit and fails.
+        full = lambda val, dtype: np.broadcast_to(np.asarray(val, dtype=dtype), shape + trail).reshape(shape)
+        feasible = np.ones(shape, dtype=bool)
+        try:
+            for axis, (key, vals) in enumerate(zip(iter_vars, iter_vals)):
+                axis_shape = [1] * len(shape)
+                axis_shape[axis] = shape[axis]
+                for j, var in enumerate(key):
+                    if var not in plan.n2s:
+                        continue
+                    slot = plan.n2s[var]
+                    if slot in plan.vectors:
+                        # Vectors of all points must have the same length.
+                        arr = np.asarray([t[j] for t in vals])
+                        state[slot] = arr.reshape(axis_shape + [arr.shape[-1]])
+                    else:
+                        state[slot] = np.asarray([t[j] for t in vals], dtype=float).reshape(axis_shape + list(trail))
+            with np.errstate(all='ignore'):
+                con_vals = plan.run(state)
+                for val in plan.constraintValues(state, con_vals):
+                    feasible &= full(val, bool)
+            target_vals = [full(state[plan.n2s[tar]], float) for tar in self.targets]
+        except (TypeError, ValueError) as e:
+            logging.info('Vectorized evaluation failed ({}), evaluating point by point.'.format(e))
+            self.solveDetermined()
+            return
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            n_evals = sum([np.size(state[out]) for _, _, out in plan.steps])
+            logging.debug('Broadcast sweep: {} element evaluations instead of {}'.format(
+                n_evals, len(plan.steps) * int(np.prod(shape))))
 
-        end = timer()
+        with np.errstate(invalid='ignore'):
+            valid = [self.type_mask(tar, vals) & (vals == vals) for tar, vals in zip(self.targets, target_vals)]
+        for i in np.flatnonzero(feasible):
+            idx = np.unravel_index(i, shape)
+            tag = tuple(itertools.chain(*[vals[d] for vals, d in zip(iter_vals, idx)]))
+            if tag in results:
+                continue
+            for tar, vals, ok in zip(self.targets, target_vals, valid):
+                results[tag].append(vals[idx].item() if ok[idx] else float("nan"))
+                logging.info('Result {} -> {} = {}'.format(tag, tar, results[tag][-1]))
 
         self.result = results
         self.variables = iter_vars
@@ -866,27 +1310,113 @@ class Interpreter(object):
         else:
             logging.error('No feasible value when plotting {}, aborting'.format(node.dependent))
 
-    def run(self):
+    def fingerprint(self):
+        """ Hash of everything compile() depends on: the assumed relations,
+        the variables, which of them are inputs and targets, and the compile options.
+        """
+        h = hashlib.sha256()
+        h.update(repr((
+            sorted([e.str for e in self.eq_set]),
+            sorted([c.str for c in self.con_set]),
+            sorted([(v, self.v2v[v].vector) for v in self.var_set]),
+            sorted(self.given.keys()),
+            sorted(self.targets) if self.prune else None,
+            self.use_z3, self.cse, self.fuse)).encode('utf-8'))
+        return h.hexdigest()
+
+    def compile(self):
+        """ Builds the functional graph of the linked model and solves its relations.
+        """
+        self.build_dependency_graph()
+
+        consistent_and_determined = self.convert_to_functional_graph()
+        self.use_smt = False
+        if not consistent_and_determined:
+            self.splitRemainder()
+            # Nothing left for the functional graph, the whole system is one SMT instance.
+            self.use_smt = self.use_z3 and not (self.decomposition.well_eqs or self.decomposition.over_eqs)
+            if not self.use_z3:
+                logging.log(logging.ERROR, 'System underdetermined, and not using z3 core, not evaluating:\n\t{}'.format(
+                    '\n\t'.join(sorted([n.val for n in self.decomposition.under_vars]))))
+        if self.use_smt:
+            return
+        self.dead = self.eliminateDead() if self.prune else set()
+        self.generate_functions()
+
+    def buildPlan(self):
+        """ Execution plan of the compiled model with the current folded inputs,
+        kept with the model for runs folding the same values.
+        """
+        key = tuple(sorted(self.foldedInputs().items())) if self.fold else None
+        if key in self.plans:
+            self.plans.move_to_end(key)
+            return self.plans[key]
+        folds = self.foldConstants(self.modules, self.printer) if self.fold else {}
+        plan = ExecutionPlan(self.graph, skip=self.remainder | self.dead, folds=folds)
+        if self.cse:
+            plan.eliminateCommonSubexpressions(self.modules, self.printer)
+        if self.fuse:
+            plan.fuse(self.modules, self.printer)
+        self.plans[key] = plan
+        while len(self.plans) > self.kCOMPILED_RUNS:
+            self.plans.popitem(last=False)
+        return plan
+
+    def prepare(self):
+        """ Links the program and compiles it, unless an earlier run compiled a
+        model of the same structure, then builds its execution plan.
+        """
         self.link()
         self.gen_inputs()
-        self.build_dependency_graph()
+        self.remainder_smt = None
+        self.model_smt = None
+        key = self.fingerprint() if self.use_cache else None
+        if key in Interpreter._compiled:
+            # Only input values changed since a previous run.
+            Interpreter._compiled.move_to_end(key)
+            logging.info('Reusing compiled model {}'.format(key[:12]))
+            for k, v in Interpreter._compiled[key].items():
+                setattr(self, k, v)
+        else:
+            self.compile()
+            self.plans = OrderedDict()  # Folded input values -> execution plan.
+            if key is not None:
+                Interpreter._compiled[key] = dict([(k, getattr(self, k, None)) for k in self.kCOMPILED])
+                while len(Interpreter._compiled) > self.kCOMPILED_RUNS:
+                    Interpreter._compiled.popitem(last=False)
+        self.plan = None if self.use_smt else self.buildPlan()
 
-        use_smt = False
+    def session(self):
+        """ Session evaluating one point of the model, see Session.
+        """
+        # Any variable can be read and any input set, not only the swept ones.
+        self.prune = False
+        self.fold = False
+        self.prepare()
+        assert not self.use_smt, 'Sessions need a functional graph, the model is solved by SMT only.'
+        return Session(self)
 
-        consistent_and_determined = self.convert_to_functional_graph()
-        if self.use_z3 and not consistent_and_determined:
-            use_smt = True
-
-        if not consistent_and_determined and not use_smt:
-            logging.log(logging.FATAL, 'System underdetermined or inconsistent, ''and not using z3 core, aborting '
-                                       'evaluation...')
-        elif consistent_and_determined and not use_smt:
-            self.generate_functions()
-            self.solveDetermined()
-        elif not consistent_and_determined and use_smt:
+    def run(self):
+        self.prepare()
+        if self.use_smt:
             logging.log(logging.ERROR,
                         'System underdetermined or inconsistent, ''trying to solve as an SMT instance...')
             self.solveSMT()
+        else:
+            if self.dump_fused:
+                self.plan.fused.dump(self.dump_fused)
+            unknowns = set([v.val for v in self.decomposition.under_vars]) if self.remainder and self.use_z3 else set()
+            if self.pareto and any([t in unknowns for t, _ in self.objectives]):
+                logging.warning('Objectives on the under-determined part are optimized by priority at every point, '
+                                'the Pareto front is only taken over the sweep.')
+            if self.vectorize:
+                self.solveVectorized()
+            else:
+                self.solveDetermined()
+        if self.objectives:
+            self.optimum = self.selectOptimum()
+            for tag in self.optimum:
+                logging.info('Optimum {} -> {}'.format(tag, dict(zip(self.targets, self.result[tag]))))
 
         self.images = []
         if self.plot_nodes:
@@ -109,8 +109,9 @@ class Program:
                                          Optional(COMMA))(Names.assumedRule)).setResultsName(Names.assume, True)
         self.assumeStmt = (Suppress('assume') + equation +
                            Optional(ZeroOrMore(COMMA.suppress() + equation))).setResultsName(Names.let, True)
-        self.solveStmt = Group(Literal('explore') +
-                               OneOrMore(term +
+        objective = Optional(Keyword(Names.minimize) | Keyword(Names.maximize))
+        self.solveStmt = Group(Literal('explore') + Optional(Keyword(Names.pareto))(Names.pareto) +
+                               OneOrMore(objective + term +
                                          Optional(COMMA.suppress()))(Names.target)).setResultsName(Names.solve, True)
         self.typeDef = Group(typeDecl + typeBody).setResultsName(Names.typeDef, True)
         self.ruleDef = Group(ruleDecl + ruleBody).setResultsName(Names.ruleDef, True)
@@ -233,7 +234,7 @@ class Program:
             logging.fatal("Fatal error:\n{}\n{}\n{}".format(err.line, " " * (err.column - 1) + "^", err))
             raise
 
-    def run(self, save=False):
+    def interpreter(self, jobs=None):
         class _Nodes(object):
             def __init__(self, nodes):
                 self.nodes = nodes  # All ast nodes.
@@ -243,7 +244,23 @@ class Program:
                     n.dump()
 
         program = _Nodes(self.ast_nodes)
-        interp = Interpreter(program, self.args.z3core, self.args.draw, self.args.mcsamples, self.callback)
+        return Interpreter(program, self.args.z3core, self.args.draw, self.args.mcsamples, self.callback,
+                           vectorize=self.args.vectorize,
+                           jobs=self.args.jobs if jobs is None else jobs,
+                           use_cache=not self.args.no_cache,
+                           fuse=self.args.fuse,
+                           dump_fused=self.args.dump_fused,
+                           cse=not self.args.no_cse,
+                           smt_timeout=self.args.smt_timeout,
+                           smt_encoding=self.args.smt_encoding)
+
+    def session(self):
+        """ Interactive session on the program, e.g. session.set('f', 0.95); session.get('speedup').
+        """
+        return self.interpreter().session()
+
+    def run(self, save=False, jobs=None):
+        interp = self.interpreter(jobs)
         # interp.test_gc_overhead()
         result = interp.run()
         if save:
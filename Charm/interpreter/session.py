@@ -0,0 +1,85 @@
+""" Interactive, incremental evaluation of a compiled model.
+"""
+
+import logging
+
+import numpy as np
+
+from .execution_plan import unwrap
+
+
+class Session(object):
+    """ One point of a model, kept up to date as its inputs change.
+
+    Inputs start at the first value of their assumption. set() only records
+    a new value; the next get() re-runs the steps downstream of the inputs
+    changed since, every other slot keeps its value. Values of the
+    under-determined part, if any, are solved by SMT on demand.
+
+    Fields:
+        interp: Interpreter the model was compiled by.
+        plan: its ExecutionPlan.
+        state: slot values of the current point.
+        changed: input slots set since the last evaluation.
+        con_vals: constraint values of the current point if its last run computed them.
+    """
+
+    def __init__(self, interp):
+        self.interp = interp
+        self.plan = interp.plan
+        self.state = self.plan.newState()
+        self.changed = set()
+        self.remainder = None  # SMT solution of the current point, if solved.
+        for key, vals in interp.given.items():
+            if len(vals) > 1:
+                logging.info('Session: {} starts at {} of {} values'.format(key, vals[0], len(vals)))
+            for var, v in zip(key, vals[0]):
+                if var in self.plan.n2s:
+                    self.__assign(self.plan.n2s[var], v)
+        self.con_vals = self.plan.run(self.state)
+
+    def __assign(self, slot, val):
+        self.state[slot] = np.asarray(val) if slot in self.plan.vectors else unwrap(val)
+
+    def inputs(self):
+        return sorted([self.plan.names[i] for i in self.plan.inputs])
+
+    def set(self, name, val):
+        """ Gives input name a new value.
+        """
+        slot = self.plan.n2s.get(name)
+        assert slot in self.plan.inputs, 'Unknown input {}, inputs are {}'.format(name, self.inputs())
+        if name in self.interp.v2t:
+            assert self.interp.type_check(name, val), \
+                'Constraint for type {} not satisfied with value {}.'.format(self.interp.v2t[name].name, val)
+        self.__assign(slot, val)
+        self.changed.add(slot)
+        self.remainder = None
+
+    def evaluate(self):
+        """ Re-runs the steps downstream of the changed inputs.
+        """
+        if self.changed:
+            self.con_vals = self.plan.run(self.state, self.changed)
+            self.changed = set()
+
+    def feasible(self):
+        """ If the current point satisfies all constraints.
+        """
+        self.evaluate()
+        return self.plan.check(self.state, self.con_vals)
+
+    def get(self, name):
+        """ Value of variable name at the current point, nan if it has none or
+        it does not satisfy its type.
+        """
+        assert name in self.plan.n2s, 'Unknown variable {}'.format(name)
+        self.evaluate()
+        slot = self.plan.n2s[name]
+        val = self.state[slot]
+        if slot not in self.plan.available and self.interp.remainder and self.interp.use_z3:
+            if self.remainder is None:
+                self.remainder = self.interp.solveRemainder(self.state) or {}
+            val = self.remainder.get(name)
+        val = self.interp.type_filter(name, val)
+        return val if val is not None else float('nan')
@@ -1,86 +1,172 @@
 import logging
 
 import z3
+from sympy import Mod, Mul, Pow, ceiling, floor, preorder_traversal
 
+from Charm.base.helpers import SympyHelper
 from .abstract_syntax_tree import IdObject
+from .z3_translator import IntTranslator, RealTranslator, Z3Translator
+
+kENCODINGS = ['auto', 'fp', 'lra', 'nra', 'nia']
+
+
+def toPython(val):
+    """ Python number of a z3 numeral in a model.
+    """
+    if z3.is_fp_value(val):
+        if val.isNaN():
+            return float('nan')
+        if val.isInf():
+            return float('-inf') if val.isNegative() else float('inf')
+        return float(z3.simplify(z3.fpToReal(val)).as_fraction())
+    if z3.is_bv_value(val):
+        return val.as_signed_long()
+    if z3.is_int_value(val):
+        return val.as_long()
+    if z3.is_rational_value(val):
+        return float(val.as_fraction())
+    if z3.is_algebraic_value(val):
+        return float(val.approx(20).as_fraction())
+    return val
+
+
+def isNonlinear(expr):
+    """ If expr multiplies, divides or takes powers of variables.
+    """
+    for e in preorder_traversal(expr):
+        if isinstance(e, Mul) and len([a for a in e.args if a.free_symbols]) > 1:
+            return True
+        if isinstance(e, Pow) and e.base.free_symbols and e.exp != 1:
+            return True
+    return False
+
+
+def chooseEncoding(types, exprs):
+    """ Cheapest exact arithmetic the relations exprs over variables of types
+    fit in: integer arithmetic when all variables are ints and no relation
+    leaves the integers, else linear or nonlinear real arithmetic.
+    """
+    nonlinear = any([isNonlinear(e) for e in exprs])
+    integral = all([t == 'int' for t in types.values()])
+    for e in exprs:
+        if not integral:
+            break
+        for a in preorder_traversal(e):
+            if (a.is_Number and not a == int(a)) or (isinstance(a, Pow) and not (a.exp.is_Integer and a.exp >= 0)):
+                integral = False
+                break
+    if integral:
+        return 'nia'
+    return 'nra' if nonlinear else 'lra'
 
 
 class SMTInstance(IdObject):
-    kSKIP = ['<', '>']
+    """ z3 solver over typed variables and relations.
 
-    def __init__(self, types, cons):
+    Relations are strings in the syntax of the language, '=' for equality,
+    or sympy expressions. They are translated by a Z3Translator shared by
+    the whole instance, assumptions included.
+
+    The encoding is the arithmetic the variables live in:
+        fp: double precision floating point, bit-precise but slowest.
+        lra: linear real arithmetic, ints are integers converted to reals.
+        nra: nonlinear real arithmetic, likewise.
+        nia: nonlinear integer arithmetic, all variables must be ints.
+        auto: the cheapest of lra, nra and nia that fits the relations.
+    Real encodings compute exactly, where fp rounds every operation.
+
+    Fields:
+        types: variable name -> 'float' or 'int'.
+        cons: relations always asserted.
+        encoding: encoding in use, never auto.
+        variables: variable name -> z3 term of the encoding's sort.
+        translator: Z3Translator over the variables.
+        solver: z3 solver.
+        timeout: seconds a check may take, None for no limit.
+    """
+
+    # Bisection: relative width of the objective bound at which it stops, and most checks per objective.
+    kTOL = 1e-9
+    kMAX_CHECKS = 200
+    # Most points of a Pareto front enumerated, a front over reals has infinitely many.
+    kMAX_FRONT = 50
+
+    def __init__(self, types, cons, timeout=None, encoding='auto'):
+        """ timeout: seconds a solve() may take, None for no limit.
+        encoding: one of kENCODINGS.
+        """
         super().__init__()
         assert isinstance(types, dict), 'Types for SMT must be a dictionary'
         assert isinstance(cons, list), 'Constraints for SMT must be a list'
+        assert encoding in kENCODINGS, 'Unknown SMT encoding {}, choose from {}'.format(encoding, kENCODINGS)
         self.types = types
         self.cons = cons
         self.asmpts = []
-        # Some may call this the dark side but
-        # put SMT variables in object locals, so that we can refer to them
-        # at other places.
-        single = 'z3.Float32()'
-        double = 'z3.Float64()'
-        BV32 = 'z3.BitVecSort(32)'
-        BV64 = 'z3.BitVecSort(64)'
-        RNE = 'z3.RNE()'
+        self.timeout = timeout
+        self.syms = SympyHelper.initSyms(list(self.types.keys()))
+        exprs = [self.__parse(con) for con in self.cons]
+        if encoding == 'auto':
+            encoding = chooseEncoding(self.types, exprs)
+        self.encoding = encoding
+        self.variables = {}
         for v in list(self.types.keys()):
-            assert v not in vars(self)
-            if self.types[v] == 'float':
-                dym_str = 'vars(self)["{}"] = z3.Const("{}", {})'.format(v, v, double)
+            assert self.types[v] in ('float', 'int')
+            if encoding == 'fp':
+                if self.types[v] == 'float':
+                    self.variables[v] = z3.Const(v, z3.Float64())
+                else:
+                    self.variables[v] = z3.fpSignedToFP(z3.RNE(), z3.Const(v, z3.BitVecSort(64)), z3.Float64())
+            elif encoding == 'nia':
+                assert self.types[v] == 'int', 'Integer SMT encoding given float variable {}'.format(v)
+                self.variables[v] = z3.Int(v)
+            elif self.types[v] == 'float':
+                self.variables[v] = z3.Real(v)
             else:
-                assert self.types[v] == 'int'
-                dym_str = 'vars(self)["{}"] = z3.fpSignedToFP({}, z3.Const("{}", {}), {})'.format(v, RNE, v, BV64, double)
-            exec(dym_str)
-        # TODO Cannot find reference to Tactic, check for problems
-        t1 = z3.Tactic('simplify')
-        t2 = z3.Tactic('solve-eqs')
-        t3 = z3.Tactic('split-clause')
-        t4 = z3.Tactic('qffpbv')
-        t5 = z3.Tactic('qfnra-nlsat')
-        t6 = z3.Tactic('normalize-bounds')
-        t7 = z3.Tactic('smt')
-        goal = z3.Then(z3.AndThen(t1, t2, t6), t4)
-        # goal = z3.AndThen(t1, t2, t6)
-        self.solver = goal.solver()
-        for con in self.cons:
-            trans_con = self.__transform(con)
-            self.solver.add(trans_con)
+                self.variables[v] = z3.ToReal(z3.Int(v))
+        if encoding == 'fp':
+            self.translator = Z3Translator(self.variables)
+        elif encoding == 'nia':
+            self.translator = IntTranslator(self.variables)
+        else:
+            self.translator = RealTranslator(self.variables)
+        self.solver = self.__solver(encoding, exprs)
+        if timeout:
+            self.solver.set('timeout', max(1, int(timeout * 1000)))
+        logging.debug('SMT instance {} over {} variables in {} encoding'.format(self.id, len(self.types), encoding))
+        for con in exprs:
+            self.solver.add(self.translator.relation(con))
+
+    def __solver(self, encoding, exprs):
+        if encoding == 'fp':
+            # TODO Cannot find reference to Tactic, check for problems
+            t1 = z3.Tactic('simplify')
+            t2 = z3.Tactic('solve-eqs')
+            t4 = z3.Tactic('qffpbv')
+            t6 = z3.Tactic('normalize-bounds')
+            return z3.Then(z3.AndThen(t1, t2, t6), t4).solver()
+        if encoding == 'nia':
+            return z3.SolverFor('QF_NIA')
+        # Ints, or floor and ceiling through ints, mix in integer arithmetic.
+        mixed = 'int' in self.types.values() or \
+            any([isinstance(a, (ceiling, floor, Mod)) for e in exprs for a in preorder_traversal(e)])
+        if encoding == 'lra':
+            return z3.SolverFor('QF_LIRA' if mixed else 'QF_LRA')
+        if mixed:
+            return z3.Solver()
+        return z3.Then('simplify', 'solve-eqs', 'qfnra-nlsat').solver()
+
+    def __parse(self, con):
+        if isinstance(con, str):
+            con = SympyHelper.initExprs([con], self.syms)[0]
+        return con
 
     def __transform(self, con):
-        # Create local variables that bind with SMT variables, so that we 
-        # do not need to convert reference in constraints to object variables.
-        for v in list(self.types.keys()):
-            dym_str = '{} = self.{}'.format(v, v)
-            exec(dym_str)
-        # TODO: dirty hack for CNN, fix this.
-        if 'ceiling' in con:
-
-            con = 'computation = (2*M*N) / '\
-                    '(z3.fpRoundToIntegral(z3.RTP(), M/T_m) * '\
-                    'z3.fpRoundToIntegral(z3.RTP(), N/T_n))'
-        # example stmt: comp = (M * N) / (ceiling(M / T_m) * ceiling(N / T_n))
-        # for occ in re.finditer('ceiling', con):
-        #    c_body = ''
-        #    stack = []
-        #    assert con[occ.end()] == '('
-        #    stack.append('(')
-        #    for i in range(occ.end() + 1, len(con)):
-        #        if con[i] == ')':
-        #            stack.pop()
-        #            if not stack:
-        #                break
-        #        elif con[i] == '(':
-        #            stack.append('(')
-        #        c_body += con[i]
-        #    assert not stack
-        #    replace_body = 'z3.If(z3.floor({}) < z3.ToReal(), z3.floor({}) + 1, z3.floor({})'.format(c_body)
-        #    print replace_body
-
-        mutable = list(con)
-        for i in range(len(mutable)):
-            if con[i] == '=':
-                mutable[i] = con[i] if con[i - 1] in self.kSKIP or con[i + 1] in self.kSKIP else '=='
-        return eval(''.join(mutable))
+        return self.translator.relation(self.__parse(con))
+
+    def __solution(self, m):
+        """ Values of the variables in model m, leaving out fresh ones of the encoding.
+        """
+        return dict([(d.name(), m[d]) for d in m.decls() if d.name() in self.types])
 
     def dump(self):
         logging.debug('{}'.format(self.solver.sexpr()))
@@ -98,12 +184,122 @@ class SMTInstance(IdObject):
     def solve(self):
         res = self.solver.check()
         if res == z3.sat:
-            m = self.solver.model()
-            result = dict([(d.name(), m[d]) for d in m.decls()])
-            return result
+            return self.__solution(self.solver.model())
         elif res == z3.unsat:
-            print('Unsatisfiable instance.')
+            logging.debug('SMT instance {} unsatisfiable.'.format(self.id))
             return None
         else:
             assert res == z3.unknown
+            reason = self.solver.reason_unknown()
+            if reason in ('timeout', 'canceled'):
+                logging.warning('SMT instance given up: {}.'.format(reason))
+                return None
             raise ValueError('z3 fails, aborting...')
+
+    def optimize(self, objectives, pareto=False):
+        """ Optimal solutions under the current assertions.
+
+        Args:
+            objectives: [(variable name, minimize)], in priority order.
+            pareto: Pareto front instead of lexicographic priority.
+        Returns:
+            [solution], one for lexicographic priority, the points of the front
+            found for pareto, at most kMAX_FRONT, empty if unsatisfiable.
+
+        Objectives of arithmetic sorts use z3's optimizer. Floating point ones,
+        which it cannot optimize, are bisected on their bound one after the
+        other; for them a Pareto front is approximated by the lexicographic optimum.
+        """
+        terms = [(self.variables[name], minimize) for name, minimize in objectives]
+        if all([z3.is_arith(t) or z3.is_bv(t) for t, _ in terms]):
+            solutions = self.__optimizeNative(terms, pareto)
+            if solutions is not None:
+                return solutions
+            logging.warning('SMT optimizer gave up, bisecting the objectives.')
+        elif pareto:
+            logging.warning('Pareto front of floating point objectives approximated by a lexicographic optimum.')
+        return self.__optimizeBisection(terms)
+
+    def __optimizeNative(self, terms, pareto):
+        opt = z3.Optimize()
+        opt.set(priority='pareto' if pareto else 'lex')
+        if self.timeout:
+            opt.set(timeout=max(1, int(self.timeout * 1000)))
+        opt.add(*self.solver.assertions())
+        for t, minimize in terms:
+            if minimize:
+                opt.minimize(t)
+            else:
+                opt.maximize(t)
+        solutions = []
+        while True:
+            res = opt.check()
+            if res != z3.sat:
+                break
+            solutions.append(self.__solution(opt.model()))
+            if not pareto:
+                break
+            if len(solutions) == self.kMAX_FRONT:
+                logging.warning('Pareto front enumeration stopped at {} points.'.format(self.kMAX_FRONT))
+                break
+        if res == z3.unknown and not solutions:
+            return None
+        return solutions
+
+    def __optimizeBisection(self, terms):
+        solution = None
+        depth = 0
+        try:
+            for t, minimize in terms:
+                solution = self.solve()
+                if solution is None:
+                    return []
+                solution, best = self.__bisect(t, minimize, solution)
+                # Later objectives must not give up on this one.
+                self.solver.push()
+                depth += 1
+                self.solver.add(t <= best if minimize else t >= best)
+        finally:
+            for _ in range(depth):
+                self.solver.pop()
+        return [solution]
+
+    def __bisect(self, term, minimize, solution):
+        """ Tightens the bound on term from its value in solution, the model of
+        the last check: the bound steps away exponentially until unsatisfiable,
+        then is bisected.
+
+        Returns the best solution and its value of term.
+        """
+        sign = 1. if minimize else -1.
+        best = sign * toPython(self.solver.model().eval(term, model_completion=True))
+        if best != best:
+            return solution, sign * best
+        lo = None
+        step = max(abs(best), 1.)
+        for _ in range(self.kMAX_CHECKS):
+            if lo is None:
+                probe = best - step
+            elif best - lo <= self.kTOL * max(1., abs(best)):
+                break
+            else:
+                probe = (lo + best) / 2.
+            bound = self.translator.number(sign * probe)
+            self.solver.push()
+            self.solver.add(term <= bound if minimize else term >= bound)
+            res = self.solver.check()
+            if res == z3.sat:
+                m = self.solver.model()
+                solution = self.__solution(m)
+                best = sign * toPython(m.eval(term, model_completion=True))
+                if lo is None:
+                    step *= 2.
+                    if step > 1e300:
+                        self.solver.pop()
+                        logging.warning('SMT objective {} is unbounded.'.format(term))
+                        break
+            else:
+                # Unknown, e.g. out of time, cannot do better either.
+                lo = probe
+            self.solver.pop()
+        return solution, sign * best
@@ -0,0 +1,263 @@
+""" Translation of sympy expressions into z3 terms.
+"""
+
+import z3
+from sympy import (Abs, Add, And, Eq, Ge, Gt, Le, Lt, Max, Min, Mod, Mul, Ne, Not, Number, Or,
+                   Piecewise, Pow, Rational, Symbol, ceiling, floor, preorder_traversal, sympify)
+from sympy.logic.boolalg import BooleanFalse, BooleanTrue
+
+
+class Z3Translator(object):
+    """ Bottom-up translator of sympy trees over declared variables into z3
+    terms of double precision floating point, rounding to nearest even.
+
+    Every subexpression is translated once and memoized, so translating
+    relations sharing subterms costs linear time in their total size.
+
+    Fields:
+        variables: name -> z3 term.
+        memo: sympy expression -> z3 term.
+        sides: sympy expression -> constraint defining the fresh variable it is
+            translated to, if any.
+    """
+
+    def __init__(self, variables):
+        self.variables = variables
+        self.memo = {}
+        self.sides = {}
+        self.sort = z3.Float64()
+        self.rounding = z3.RNE()
+
+    def relation(self, expr):
+        """ z3 term of a relation, with the constraints defining the fresh
+        variables it refers to.
+        """
+        term = self.translate(expr)
+        if not self.sides:
+            return term
+        defs = [self.sides[e] for e in set(preorder_traversal(expr)) if e in self.sides]
+        return z3.And(term, *defs) if defs else term
+
+    def translate(self, expr):
+        if expr not in self.memo:
+            self.memo[expr] = self.__translate(expr)
+        return self.memo[expr]
+
+    def __translate(self, expr):
+        if isinstance(expr, Symbol):
+            if expr.name not in self.variables:
+                raise NotImplementedError('Undeclared SMT variable {}'.format(expr.name))
+            return self.variables[expr.name]
+        if isinstance(expr, BooleanTrue):
+            return z3.BoolVal(True)
+        if isinstance(expr, BooleanFalse):
+            return z3.BoolVal(False)
+        if isinstance(expr, Number):
+            return self.number(expr)
+        if isinstance(expr, Add):
+            terms = list(expr.args)
+            res = self.translate(terms[0])
+            for t in terms[1:]:
+                if t.could_extract_minus_sign():
+                    res = res - self.translate(-t)
+                else:
+                    res = res + self.translate(t)
+            return res
+        if isinstance(expr, Mul):
+            return self.mul(expr)
+        if isinstance(expr, Pow):
+            return self.pow(expr.base, expr.exp)
+        if isinstance(expr, Eq):
+            return self.translate(expr.lhs) == self.translate(expr.rhs)
+        if isinstance(expr, Ne):
+            return self.translate(expr.lhs) != self.translate(expr.rhs)
+        if isinstance(expr, Lt):
+            return self.translate(expr.lhs) < self.translate(expr.rhs)
+        if isinstance(expr, Le):
+            return self.translate(expr.lhs) <= self.translate(expr.rhs)
+        if isinstance(expr, Gt):
+            return self.translate(expr.lhs) > self.translate(expr.rhs)
+        if isinstance(expr, Ge):
+            return self.translate(expr.lhs) >= self.translate(expr.rhs)
+        if isinstance(expr, And):
+            return z3.And(*[self.translate(a) for a in expr.args])
+        if isinstance(expr, Or):
+            return z3.Or(*[self.translate(a) for a in expr.args])
+        if isinstance(expr, Not):
+            return z3.Not(self.translate(expr.args[0]))
+        if isinstance(expr, Piecewise):
+            # The last piece is the default, pieces after a true condition are unreachable.
+            if not isinstance(expr.args[-1][1], BooleanTrue):
+                raise NotImplementedError('Cannot translate {} to SMT, it is undefined where no condition '
+                                          'holds'.format(expr))
+            res = self.translate(expr.args[-1][0])
+            for val, cond in reversed(expr.args[:-1]):
+                res = z3.If(self.translate(cond), self.translate(val), res)
+            return res
+        if isinstance(expr, (Max, Min)):
+            args = [self.translate(a) for a in expr.args]
+            res = args[0]
+            for a in args[1:]:
+                res = z3.If(a > res, a, res) if isinstance(expr, Max) else z3.If(a < res, a, res)
+            return res
+        if isinstance(expr, ceiling):
+            return self.ceiling(self.translate(expr.args[0]))
+        if isinstance(expr, floor):
+            return self.floor(self.translate(expr.args[0]))
+        if isinstance(expr, Abs):
+            return self.abs(self.translate(expr.args[0]))
+        if isinstance(expr, Mod):
+            return self.mod(self.translate(expr.args[0]), self.translate(expr.args[1]))
+        raise NotImplementedError('Cannot translate {} to SMT'.format(expr))
+
+    def mul(self, expr):
+        """ Products with factors of negative integer power are divisions.
+        """
+        coeff, factors = expr.as_coeff_mul()
+        num, den = [], []
+        negate = False
+        if isinstance(coeff, Rational):
+            negate = coeff < 0
+            if abs(coeff.p) != 1:
+                num.append(self.number(Rational(abs(coeff.p))))
+            if coeff.q != 1:
+                den.append(self.number(Rational(coeff.q)))
+        elif coeff != 1:
+            num.append(self.number(coeff))
+        for f in factors:
+            if isinstance(f, Pow) and f.exp.is_Integer and f.exp < 0:
+                den.append(self.translate(f.base ** -f.exp))
+            else:
+                num.append(self.translate(f))
+        res = num[0] if num else self.number(Rational(1))
+        for f in num[1:]:
+            res = res * f
+        for f in den:
+            res = res / f
+        return -res if negate else res
+
+    def pow(self, base, exp):
+        x = self.translate(base)
+        if exp == Rational(1, 2):
+            return self.sqrt(x)
+        if exp.is_Integer and exp != 0:
+            res = x
+            for _ in range(abs(int(exp)) - 1):
+                res = res * x
+            return res if exp > 0 else self.number(Rational(1)) / res
+        if exp == 0:
+            return self.number(Rational(1))
+        raise NotImplementedError('Cannot translate power {}**{} to SMT'.format(base, exp))
+
+    # Encoding of numbers and rounding, over the sort of the variables.
+
+    def number(self, val):
+        return z3.FPVal(float(val), self.sort)
+
+    def sqrt(self, x):
+        return z3.fpSqrt(self.rounding, x)
+
+    def ceiling(self, x):
+        return z3.fpRoundToIntegral(z3.RTP(), x)
+
+    def floor(self, x):
+        return z3.fpRoundToIntegral(z3.RTN(), x)
+
+    def abs(self, x):
+        return z3.fpAbs(x)
+
+    def mod(self, x, y):
+        # Floored like sympy's Mod, fpRem rounds the quotient to nearest.
+        return x - y * self.floor(x / y)
+
+
+class RealTranslator(Z3Translator):
+    """ Translator into real arithmetic, numbers are exact.
+
+    Floor and ceiling go through integers, a square root is a fresh
+    non-negative variable whose square is its argument.
+    """
+
+    def __init__(self, variables):
+        super(RealTranslator, self).__init__(variables)
+        self.sort = z3.RealSort()
+
+    def pow(self, base, exp):
+        if exp == Rational(1, 2):
+            root = z3.FreshReal('sqrt')
+            self.sides[Pow(base, exp)] = z3.And(root >= 0, root * root == self.translate(base))
+            return root
+        return super(RealTranslator, self).pow(base, exp)
+
+    def number(self, val):
+        if isinstance(val, Rational):
+            return z3.RatVal(int(val.p), int(val.q))
+        # Shortest decimal of the double, i.e. as written.
+        return z3.RealVal(repr(float(val)))
+
+    def ceiling(self, x):
+        return -z3.ToReal(z3.ToInt(-x))
+
+    def floor(self, x):
+        return z3.ToReal(z3.ToInt(x))
+
+    def abs(self, x):
+        return z3.If(x >= 0, x, -x)
+
+
+class IntTranslator(Z3Translator):
+    """ Translator into integer arithmetic.
+
+    Quotients are only translated under floor and ceiling, which round them
+    exactly; any other division is rejected, it may not be an integer.
+    """
+
+    def __init__(self, variables):
+        super(IntTranslator, self).__init__(variables)
+        self.sort = z3.IntSort()
+
+    def translate(self, expr):
+        if isinstance(expr, (ceiling, floor)) and expr not in self.memo:
+            num, den = expr.args[0].as_numer_denom()
+            if den != 1:
+                n, d = self.translate(num), self.translate(den)
+                self.memo[expr] = self.floorDiv(n, d) if isinstance(expr, floor) else -self.floorDiv(-n, d)
+        return super(IntTranslator, self).translate(expr)
+
+    @staticmethod
+    def floorDiv(n, d):
+        # z3 integer division is euclidean, it rounds up for negative divisors.
+        return z3.If(d > 0, n / d, -n / -d)
+
+    def mul(self, expr):
+        if expr.as_numer_denom()[1] != 1:
+            raise NotImplementedError('Division in {} may not be an integer, cannot translate to integer '
+                                      'arithmetic outside floor or ceiling'.format(expr))
+        return super(IntTranslator, self).mul(expr)
+
+    def pow(self, base, exp):
+        if exp.is_Integer and exp < 0:
+            raise NotImplementedError('Division in {}**{} may not be an integer, cannot translate to integer '
+                                      'arithmetic outside floor or ceiling'.format(base, exp))
+        return super(IntTranslator, self).pow(base, exp)
+
+    def number(self, val):
+        val = sympify(val)
+        if not val.is_Integer and not (val.is_Float and val == int(val)):
+            raise NotImplementedError('{} is not an integer, cannot translate to integer arithmetic'.format(val))
+        return z3.IntVal(int(val))
+
+    def sqrt(self, x):
+        raise NotImplementedError('Cannot translate square roots to integer arithmetic')
+
+    def ceiling(self, x):
+        return x
+
+    def floor(self, x):
+        return x
+
+    def abs(self, x):
+        return z3.If(x >= 0, x, -x)
+
+    def mod(self, x, y):
+        return x - y * self.floorDiv(x, y)
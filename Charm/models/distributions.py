@@ -3,6 +3,7 @@ import logging
 import mcerp3 as mcerp
 import numpy as np
 import scipy.stats as ss
+from Charm.base.uncertain_math import condmax, uncertain
 from Charm.utils.boxcox import BoxCox
 from Charm.utils.kde import Transformations
 
@@ -251,13 +252,8 @@ class Distribution(object):
         Each sample of x will be set to max(samples of dists) or non_zero_factor.
         """
         assert(dists)
-        x = mcerp.N(0, 1) # dummy, could be any UncertainVariable
-        mcpts = [None] * mcerp.npts
-        for i in range(mcerp.npts):
-            mcpts[i] = max([d._mcpts[i] for d in dists])
-            mcpts[i] = mcpts[i] if mcpts[i] else Distribution.NON_ZERO_FACTOR
-        x._mcpts = mcpts
-        return x
+        pts = np.max([d._mcpts for d in dists], axis=0)
+        return uncertain(np.where(pts != 0, pts, Distribution.NON_ZERO_FACTOR))
 
     @staticmethod
     def ConditionalMax(ns, ps):
@@ -273,35 +269,4 @@ class Distribution(object):
             x: result distribution.
         """
         assert(ns and ps)
-
-        if isinstance(ns[0], UncertainFunction) and isinstance(ps[0], UncertainFunction):
-            logging.debug('CustomDist -- Distributional candidates with distributional conditions.')
-            x = mcerp.N(0, 1) # dummy, could be any UncertainVariable
-            mcpts = [None] * mcerp.npts
-            for i in range(mcerp.npts):
-                candidate = [p._mcpts[i] for n, p in zip(ns, ps) if n._mcpts[i] > 0]
-                mcpts[i] = max(candidate) if candidate else Distribution.NON_ZERO_FACTOR
-            x._mcpts = mcpts
-            return x
-        elif isinstance(ns[0], UncertainFunction) and not isinstance(ps[0], UncertainFunction):
-            logging.debug('CustomDist -- Scalar candidates with distributional conditions.')
-            x= mcerp.N(1, 1)
-            mcpts = [None] * mcerp.npts
-            for i in range(mcerp.npts):
-                candidate = [p for n, p in zip(ns, ps) if n._mcpts[i] > 0]
-                mcpts[i] = max(candidate) if candidate else Distribution.NON_ZERO_FACTOR
-            x._mcpts = mcpts
-            return x
-        elif not isinstance(ns[0], UncertainFunction) and isinstance(ps[0], UncertainFunction):
-            logging.debug('CustomDist -- Distributional candidates with scalar conditions.')
-            x = mcerp.N(1, 1)
-            mcpts = [None] * mcerp.npts
-            for i in range(mcerp.npts):
-                candidate = [p._mcpts[i] for n, p in zip(ns, ps) if n > 0]
-                mcpts[i] = max(candidate) if candidate else Distribution.NON_ZERO_FACTOR
-            x._mcpts = mcpts
-            return x
-        else:
-            logging.debug('CustomDist -- Scalar candidates with scalar conditions.')
-            candidate = [p for n, p in zip(ns, ps) if n > 0]
-            return np.amax(candidate)
+        return condmax(ns, ps, Distribution.NON_ZERO_FACTOR)
@@ -30,6 +30,23 @@ def addCompilerOptions(parser):
             help='Use Z3 as core engine.')
     parser.add_argument('--mcsamples', type=int, action='store', default=100,
             help='Number of samples to use for uncertain variables.')
+    parser.add_argument('--vectorize', action='store_true', default=False,
+            help='Evaluate all sweep points at once with arrays.')
+    parser.add_argument('--jobs', type=int, action='store', default=1,
+            help='Number of worker processes used for sweeps.')
+    parser.add_argument('--smt-timeout', type=float, action='store', default=None, metavar='SECONDS',
+            help='Give up on an SMT sweep point after SECONDS, leaving it out of the results.')
+    parser.add_argument('--smt-encoding', choices=['auto', 'fp', 'lra', 'nra', 'nia'], default='auto',
+            help='Arithmetic of SMT instances: floating point (fp), linear or nonlinear real (lra, nra) or '
+                 'nonlinear integer (nia); auto picks the cheapest exact one fitting the relations.')
+    parser.add_argument('--no-cache', action='store_true', default=False,
+            help='Do not reuse solved equations cached on disk, nor models compiled earlier in the process.')
+    parser.add_argument('--no-cse', action='store_true', default=False,
+            help='Do not share common subexpressions across equations.')
+    parser.add_argument('--fuse', action='store_true', default=False,
+            help='Generate a single function evaluating the whole model.')
+    parser.add_argument('--dump-fused', action='store', default=None, metavar='PATH',
+            help='Write the source of the fused model to PATH, implies --fuse.')
 
 def addIOOptions(parser):
     parser.add_argument('--save-path', action='store', default=None,
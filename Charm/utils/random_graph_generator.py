@@ -10,7 +10,7 @@ def getName(i):
     name = ''
     while(True):
         name = str(chr(a + i % 7)) + name
-        i = i / 7
+        i = i // 7
         if i == 0:
             break
         i += -1
@@ -0,0 +1,30 @@
+import os
+import sys
+from collections import OrderedDict
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Charm.interpreter.interpreter import Interpreter  # noqa: E402
+from Charm.interpreter.parser import Program  # noqa: E402
+from Charm.utils.charm_options import addCommonOptions, addCompilerOptions, addIOOptions, get_parser  # noqa: E402
+
+
+@pytest.fixture
+def program(tmp_path, monkeypatch):
+    """ Program(source, *options) of a model source, with its own equation and compiled model caches.
+    """
+    monkeypatch.setenv('CHARM_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(Interpreter, '_compiled', OrderedDict())
+
+    def make(src, *options):
+        path = tmp_path / 'model.charm'
+        path.write_text(src)
+        parser = get_parser()
+        addCommonOptions(parser)
+        addCompilerOptions(parser)
+        addIOOptions(parser)
+        return Program(src, parser.parse_args([str(path)] + list(options)))
+
+    return make
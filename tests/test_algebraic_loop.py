@@ -0,0 +1,61 @@
+import logging
+import math
+
+import pytest
+
+kCOUPLED = '''typedef R+ : float r
+    r > 0
+
+define coupled:
+    x : R+
+    y : R+
+    a : R+
+    z : R+
+    x + y = a
+    x * y = 2
+    z = x + 2 * y
+
+given coupled
+assume a = {}
+explore x, y, z
+'''
+
+
+def test_coupled_system_converges(program):
+    result = program(kCOUPLED.format('[3.5, 4., 5.]')).run()['raw']
+    assert len(result) == 3
+    for (a,), (x, y, z) in result.items():
+        assert x + y == pytest.approx(a)
+        assert x * y == pytest.approx(2.)
+        assert z == pytest.approx(x + 2 * y)
+
+
+@pytest.mark.parametrize('options', [(), ('--vectorize',)])
+def test_no_root_is_nan(program, caplog, options):
+    # x + y = 1 and x * y = 2 have no real solution.
+    with caplog.at_level(logging.WARNING):
+        result = program(kCOUPLED.format('[1., 3.]'), *options).run()['raw']
+    assert 'no solution found' in caplog.text
+    assert (1.,) not in result or all([math.isnan(v) for v in result[(1.,)]])
+    x, y, _ = result[(3.,)]
+    assert x + y == pytest.approx(3.) and x * y == pytest.approx(2.)
+
+
+def test_runs_do_not_share_guesses(program):
+    fresh = program(kCOUPLED.format('[3.]')).run()['raw'][(3.,)]
+    # The sweep solves a = 3 from the root at a = 6, a later run must not.
+    swept = program(kCOUPLED.format('[12., 6., 3.]')).run()['raw'][(3.,)]
+    again = program(kCOUPLED.format('[3.]')).run()['raw'][(3.,)]
+    assert again == fresh
+    assert sorted(swept[:2]) == pytest.approx(sorted(fresh[:2]))
+
+
+def test_sessions_do_not_share_guesses(program):
+    first = program(kCOUPLED.format('3.')).session()
+    second = program(kCOUPLED.format('3.')).session()
+    x = second.get('x')
+    for a in (12., 6., 3.):
+        first.set('a', a)
+        first.get('x')
+    second.set('a', 3.)
+    assert second.get('x') == x
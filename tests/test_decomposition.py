@@ -0,0 +1,105 @@
+import logging
+
+import networkx as nx
+import pytest
+from networkx.algorithms import bipartite
+
+from Charm.interpreter import interpreter
+from Charm.interpreter.decomposition import Decomposition
+
+
+def decompose(edges, variables):
+    graph = nx.Graph(edges)
+    match = bipartite.maximum_matching(graph, top_nodes=variables)
+    return Decomposition(graph, set(variables), match, dict([(n, n) for n in graph]))
+
+
+def test_parts():
+    d = decompose([('x', 'e1'), ('y', 'e1'), ('x', 'e2'), ('y', 'e2'), ('x', 'e3'),
+                   ('z', 'e4'), ('x', 'e4'),
+                   ('u', 'e5'), ('v', 'e5'), ('z', 'e5')],
+                  ['x', 'y', 'z', 'u', 'v'])
+    assert (d.over_vars, d.over_eqs) == ({'x', 'y'}, {'e1', 'e2', 'e3'})
+    assert (d.well_vars, d.well_eqs) == ({'z'}, {'e4'})
+    assert (d.under_vars, d.under_eqs) == ({'u', 'v'}, {'e5'})
+    assert not d.isDetermined()
+
+
+kOVER = '''typedef R+ : float r
+    r > 0
+
+define m:
+    a : R+
+    x : R+
+    y : R+
+    x = 2 * a
+    y = x + 1
+    y = 2 * a + {}
+
+given m
+assume a = [1., 2.]
+explore y
+'''
+
+
+@pytest.mark.parametrize('offset, feasible', [('1', True), ('2', False)])
+def test_redundant_equation_is_checked(program, offset, feasible):
+    interp = program(kOVER.format(offset), '--z3core').interpreter()
+    result = interp.run()['raw']
+    assert not interp.remainder and not interp.use_smt
+    assert len(interp.decomposition.over_eqs) == 3
+    assert dict(result) == ({(1.,): [3.], (2.,): [5.]} if feasible else {})
+
+
+kUNDER = '''typedef R+ : float r
+    r > 0
+
+typedef Big : float r
+    r >= 1
+
+define m:
+    a : R+
+    b : R+
+    c : Big
+    d : R+
+    e : R+
+    b = 2 * a
+    c + d = b
+    d <= 10
+    e = b + 1
+
+given m
+assume a = [1., 2.]
+explore b, c, max d, e
+'''
+
+
+def test_remainder_asserts_types(program):
+    interp = program(kUNDER, '--z3core').interpreter()
+    result = interp.run()['raw']
+    assert not interp.use_smt
+    assert sorted([sorted(n.val.names) for n in interp.remainder]) == [['b', 'c', 'd'], ['d']]
+    assert {'c>=1', 'd>0'} <= set(interp.remainder_smt.cons)
+    for (a,), (b, c, d, e) in result.items():
+        assert (b, e) == (2 * a, 2 * a + 1)
+        # d is largest when c is at the bound of its type.
+        assert (c, d) == pytest.approx((1., b - 1.))
+
+
+def test_remainder_optimizes_pareto_objectives_by_priority(program, caplog):
+    interp = program(kUNDER.replace('explore b', 'explore pareto b'), '--z3core').interpreter()
+    with caplog.at_level(logging.WARNING):
+        result = interp.run()['raw']
+    assert 'optimized by priority' in caplog.text
+    assert len(result) == 2 and all([c == pytest.approx(1.) for _, c, _, _ in result.values()])
+
+
+def test_determined_model_builds_no_smt_instance(program, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError('SMT instance built for a determined model')
+
+    monkeypatch.setattr(interpreter, 'SMTInstance', fail)
+    interp = program(kOVER.format('1'), '--z3core').interpreter()
+    interp.run()
+    assert interp.decomposition.isDetermined()
+    assert interp.remainder_smt is None and interp.model_smt is None
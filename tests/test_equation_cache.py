@@ -0,0 +1,56 @@
+import os
+
+import pytest
+from sympy import Eq, Function, Max, Piecewise, Rational, Symbol, ceiling, pi, sqrt, srepr, symbols
+
+from Charm.interpreter.equation_cache import EquationCache, fromSrepr
+
+
+def test_srepr_round_trips():
+    x, y = symbols('x y')
+    for expr in [Piecewise((x, x > 0), (y, True)), Function('Gauss')(x, 2.5), Max(x, 3) + Rational(1, 2) * pi,
+                 Eq(x, -3), sqrt(x), ceiling(x / 3), Symbol('a', positive=True), [x, y]]:
+        assert fromSrepr(srepr(expr)) == expr
+
+
+def test_entry_round_trips(tmp_path):
+    cache = EquationCache(str(tmp_path))
+    x = Symbol('x')
+    key = cache.key('x = 2*y', 'x')
+    cache.put(key, 2 * x + 1)
+    assert cache.get(key) == 2 * x + 1
+    assert cache.hits == 1
+
+
+def test_corrupt_entry_is_dropped(tmp_path):
+    cache = EquationCache(str(tmp_path))
+    key = cache.key('corrupt')
+    path = os.path.join(str(tmp_path), key + EquationCache.kSUFFIX)
+    with open(path, 'w') as ofile:
+        ofile.write("Add(Symbol('x'), ")
+    assert cache.get(key) is None
+    assert not os.path.exists(path)
+
+
+def test_stale_entry_is_not_used(tmp_path, monkeypatch):
+    cache = EquationCache(str(tmp_path))
+    cache.put(cache.key('x = 2*y', 'x'), 2 * Symbol('y'))
+    # Solutions of another sympy version are never looked up.
+    monkeypatch.setattr('sympy.__version__', '0.0')
+    assert cache.get(cache.key('x = 2*y', 'x')) is None
+
+
+@pytest.mark.parametrize('text', ["__import__('os').system('touch pwned')",
+                                  "Symbol('x').subs",
+                                  "(lambda: Symbol('x'))()",
+                                  "eval(\"Symbol('x')\")",
+                                  "Symbol.__init__(Symbol('x'))"])
+def test_malicious_srepr_is_rejected(tmp_path, text):
+    with pytest.raises(ValueError):
+        fromSrepr(text)
+    cache = EquationCache(str(tmp_path))
+    key = cache.key(text)
+    with open(os.path.join(str(tmp_path), key + EquationCache.kSUFFIX), 'w') as ofile:
+        ofile.write(text)
+    assert cache.get(key) is None
+    assert not os.path.exists('pwned')
@@ -0,0 +1,57 @@
+import pytest
+
+from Charm.interpreter.execution_plan import CheckedRun
+
+kMODEL = '''typedef R+ : float r
+    r > 0
+
+define m:
+    a : R+
+    b : R+
+    x : R+
+    y : R+
+    x = 2 * a
+    x <= 10
+    y = x + b
+
+given m
+assume a = [1., 4., 6., 2.]
+assume b = [1., 2.]
+explore x, y
+'''
+
+
+def test_violation_stops_the_point(program):
+    interp = program(kMODEL).interpreter()
+    interp.prepare()
+    plan = interp.plan
+    n2s = plan.n2s
+    state = plan.newState()
+    checked = CheckedRun(plan, state)
+    state[n2s['a']], state[n2s['b']] = 6., 1.
+    assert not checked.run()
+    # y comes after the violated constraint, it is not computed.
+    assert state[n2s['x']] == 12. and state[n2s['y']] is None
+    state[n2s['b']] = 2.
+    assert not checked.run([n2s['b']])
+    assert state[n2s['y']] is None
+    state[n2s['a']] = 2.
+    assert checked.run([n2s['a']])
+    assert state[n2s['y']] == 6.
+
+
+def test_same_results_as_unpruned_run(program):
+    interp = program(kMODEL).interpreter()
+    result = interp.run()['raw']
+    plan = interp.plan
+    expected = {}
+    for a in [1., 4., 6., 2.]:
+        for b in [1., 2.]:
+            state = plan.newState()
+            state[plan.n2s['a']], state[plan.n2s['b']] = a, b
+            plan.run(state)
+            if plan.check(state):
+                expected[(a, b)] = [state[plan.n2s['x']], state[plan.n2s['y']]]
+    assert len(expected) == 6
+    assert dict(result) == expected
+    assert dict(program(kMODEL, '--fuse').run()['raw']) == expected
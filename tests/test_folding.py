@@ -0,0 +1,49 @@
+import logging
+
+import pytest
+
+kMODEL = '''typedef R+ : float r
+    r > 0
+
+define m:
+    a : R+
+    b : R+
+    k : R+
+    x : R+
+    y : R+
+    k = b * b + 1
+    x = k * a
+    y = x / b
+    b <= 4
+    x <= 30
+
+given m
+assume a = [1., 2., 3., 4.]
+assume b = {}
+explore x, y
+'''
+
+
+def run(program, b, fold, *options):
+    interp = program(kMODEL.format(b), *options).interpreter()
+    interp.fold = fold
+    return dict(interp.run()['raw'])
+
+
+@pytest.mark.parametrize('options', [(), ('--fuse',), ('--vectorize',)])
+def test_folding_through_cached_model(program, caplog, options):
+    reused = 0
+    for b in ['3.', '2.', '3.', '5.']:
+        caplog.clear()
+        with caplog.at_level(logging.INFO):
+            folded = run(program, b, True, *options)
+        reused += caplog.text.count('Reusing compiled model')
+        unfolded = run(program, b, False, *options)
+        # Folding b into y = x / b multiplies by 1 / b, which may round differently.
+        assert sorted(folded) == sorted(unfolded)
+        for key in folded:
+            assert folded[key] == pytest.approx(unfolded[key], rel=1e-15, abs=0)
+    assert reused == 3
+    # b = 5 violates its constraint, b = 3 leaves x = 10 * a <= 30 up to a = 3.
+    assert not folded
+    assert sorted(run(program, '3.', True, *options)) == [(1., 3.), (2., 3.), (3., 3.)]
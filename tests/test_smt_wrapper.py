@@ -0,0 +1,50 @@
+import pytest
+import z3
+from sympy import Piecewise, Symbol
+
+from Charm.interpreter.smt_wrapper import SMTInstance, toPython
+from Charm.interpreter.z3_translator import Z3Translator
+
+
+def values(solution):
+    return dict([(k, toPython(v)) for k, v in solution.items()])
+
+
+def test_pareto_front_over_reals_is_capped():
+    smt = SMTInstance({'s': 'float', 'x': 'float', 'y': 'float'},
+                      ['x + y = s', 'x <= 8', 'y <= 8', 'x > 0', 'y > 0', 's = 10'])
+    assert smt.encoding == 'lra'
+    front = [values(sol) for sol in smt.optimize([('x', True), ('y', True)], pareto=True)]
+    assert 0 < len(front) <= SMTInstance.kMAX_FRONT
+    for point in front:
+        assert point['x'] + point['y'] == pytest.approx(10.)
+        assert 2. <= point['x'] <= 8.
+
+
+@pytest.mark.parametrize('encoding', ['nia', 'lra', 'nra'])
+def test_integer_quotients_round_exactly(encoding):
+    smt = SMTInstance({'M': 'int', 'T': 'int', 'k': 'int', 'f': 'int'},
+                      ['M = 7', 'T = -2', 'k = ceiling(M/T)', 'f = floor(M/T)'], encoding=encoding)
+    point = values(smt.solve())
+    assert (point['k'], point['f']) == (-3, -4)
+
+
+def test_integer_encoding_rejects_inexact_division():
+    with pytest.raises(NotImplementedError):
+        SMTInstance({'M': 'int', 'T': 'int', 'k': 'int'}, ['M = 7', 'T = 2', 'k = M/T'], encoding='nia')
+
+
+@pytest.mark.parametrize('encoding', ['fp', 'nia', 'lra', 'nra'])
+def test_encodings_agree_on_mod(encoding):
+    # Floored like sympy's Mod, the IEEE remainder of 7 by 2 would be -1.
+    for m, t, r in [(7, 2, 1), (-7, 2, 1), (7, -2, -1), (6, 3, 0)]:
+        smt = SMTInstance({'M': 'int', 'T': 'int', 'r': 'int'},
+                          ['M = {}'.format(m), 'T = {}'.format(t), 'r = Mod(M, T)'], encoding=encoding)
+        assert values(smt.solve())['r'] == r
+
+
+def test_piecewise_without_default_is_rejected():
+    x = Symbol('x')
+    translator = Z3Translator({'x': z3.FP('x', z3.Float64())})
+    with pytest.raises(NotImplementedError):
+        translator.translate(Piecewise((x, x > 0)))
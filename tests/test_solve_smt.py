@@ -0,0 +1,27 @@
+import pytest
+
+kMODEL = '''typedef N : int n
+    n >= 0
+
+define m:
+    a : N
+    b : N
+    c : N
+    d : N
+    a + b + d = c
+    d >= 2
+    d <= 2
+
+given m
+assume (a, c) = {}
+explore b, d
+'''
+
+
+@pytest.mark.parametrize('given', ['(3, 10)', '[(3, 10)]'])
+def test_tuple_keyed_scalar(program, given):
+    # Nothing determines b and d apart, the whole model is one SMT instance.
+    interp = program(kMODEL.format(given), '--z3core').interpreter()
+    result = interp.run()['raw']
+    assert interp.use_smt
+    assert dict(result) == {(3, 10): [5, 2]}
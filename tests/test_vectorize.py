@@ -0,0 +1,44 @@
+import logging
+
+import pytest
+
+kVECTOR_MODEL = '''typedef NatI : int i
+    i >= 0
+
+typedef R+ : float r
+    r > 0
+
+define chip:
+    DN[] : NatI
+    A[] : R+
+    P[] : R+
+    best : R+ as b
+    worst : R+ as w
+    total : R+ as t
+    budget : R+ as m
+    scale : R+ as s
+    P = A ** .5
+    b = s * Max(P[i] | DN[i] > 0)
+    w = Min(P[i] | DN[i] > 0) + 1
+    t = Sum(P[i] * DN[i] | A[i] > 2)
+    m >= Max(A[i] | DN[i] > 0)
+
+given chip
+assume A[] = list((1., 4., 9., 16., 25.))
+assume DN[] = list((0, 2, 1, 0, 3))
+assume budget = [20., 30.]
+assume scale = [1., 2., 3.]
+explore best, worst, total
+'''
+
+
+@pytest.mark.parametrize('options', [('--vectorize',), ('--vectorize', '--fuse')])
+def test_list_conditions_are_batched(program, caplog, options):
+    expected = program(kVECTOR_MODEL).run()['raw']
+    with caplog.at_level(logging.DEBUG):
+        result = program(kVECTOR_MODEL, *options).run()['raw']
+    assert 'Broadcast sweep' in caplog.text
+    assert 'cannot be vectorized' not in caplog.text
+    # The budget of 20 violates the constraint.
+    assert len(expected) == 3
+    assert dict(result) == dict(expected)